@@ -0,0 +1,84 @@
+import hashlib
+import json
+
+from django.apps import apps
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+def make_key(prefix, *parts):
+    """Cache key from the hash of the JSON dumped parts"""
+    data = json.dumps(parts, cls=DjangoJSONEncoder, sort_keys=True, default=str)
+    return f'{prefix}:{hashlib.sha256(data.encode()).hexdigest()}'
+
+
+def get_model_tag(model):
+    return model._meta.label_lower
+
+
+def get_query_tables(node, tables=None):
+    """Tables read by the query, its joins and the subqueries of its filters"""
+    tables = set() if tables is None else tables
+    query = getattr(node, 'query', None)
+    if hasattr(node, 'alias_map'):
+        tables.update(join.table_name for join in node.alias_map.values())
+        tables.add(node.model._meta.db_table)
+        get_query_tables(node.where, tables)
+    elif query is not None and hasattr(query, 'alias_map'):
+        get_query_tables(query, tables)
+    else:
+        children = [*getattr(node, 'children', ()), getattr(node, 'lhs', None), getattr(node, 'rhs', None)]
+        if hasattr(node, 'get_source_expressions'):
+            children += node.get_source_expressions()
+        for child in children:
+            if child is not None:
+                get_query_tables(child, tables)
+    return tables
+
+
+def get_queryset_tags(queryset):
+    """Tags of the models of every table the queryset reads, so changes of a filtered relation outdate it"""
+    models = {model._meta.db_table: model for model in apps.get_models(include_auto_created=True)}
+    return sorted({
+        get_model_tag(models[table]) for table in get_query_tables(queryset.query) if table in models
+    })
+
+
+def get_tags_version(tags):
+    """Current versions of the tags, every invalidation bumps the version of the tag"""
+    keys = [f'tag:{tag}' for tag in tags]
+    versions = cache.get_many(keys)
+    return ':'.join(str(versions.get(key, 0)) for key in keys)
+
+
+def invalidate_tags(*tags):
+    """Make outdated every cached value stored with one of the tags"""
+    for tag in tags:
+        key = f'tag:{tag}'
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+def invalidate_models(*models):
+    """Make outdated every cached value stored with the tags of the models"""
+    invalidate_tags(*(get_model_tag(model) for model in models))
+
+
+def get_versioned_key(key, tags=()):
+    """
+    Key for the current versions of the tags, take it before computing the value
+    so an invalidation during the computation isn't lost
+    """
+    return f'{key}:{get_tags_version(tags)}'
+
+
+def get_or_set(key, function, tags=(), timeout=None):
+    """Get the value from the cache or store the result of the function with the tags"""
+    key = get_versioned_key(key, tags)
+    value = cache.get(key)
+    if value is None:
+        value = function()
+        cache.set(key, value, timeout)
+    return value
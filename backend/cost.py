@@ -0,0 +1,119 @@
+from django.conf import settings
+from graphql.language import ast
+from graphql.type.definition import GraphQLList, GraphQLNonNull, get_named_type
+
+
+class QueryCost:
+    """
+    Static cost of an operation: every object field costs 1 times the size of its lists.
+    Also collects the root fields and the types the operation selects.
+    """
+
+    def __init__(self, schema, document, operation_name=None):
+        self.schema = schema
+        self.fragments = {
+            definition.name.value: definition
+            for definition in document.definitions
+            if isinstance(definition, ast.FragmentDefinition)
+        }
+        self.operation = self.get_operation(document, operation_name)
+        self.page_size = settings.GRAPHENE.get('PAGE_SIZE', 10)
+        self.list_size = settings.GRAPHENE.get('LIST_COST_MULTIPLIER', 10)
+        self.cost = 0
+        self.depth = 0
+        self.root_fields = set()
+        self.type_names = set()
+
+        if self.operation is not None:
+            root_type = {
+                'query': schema.get_query_type(),
+                'mutation': schema.get_mutation_type(),
+                'subscription': schema.get_subscription_type(),
+            }.get(self.operation.operation)
+            if root_type is not None:
+                self.cost = self.get_selection_cost(root_type, self.operation.selection_set, 1, ())
+
+    @staticmethod
+    def get_operation(document, operation_name):
+        operations = [
+            definition for definition in document.definitions
+            if isinstance(definition, ast.OperationDefinition)
+        ]
+        for operation in operations:
+            if operation_name is None or (operation.name and operation.name.value == operation_name):
+                return operation
+        return None
+
+    def get_multiplier(self, parent_type, name, field_type):
+        """Expected number of items of the field"""
+        multiplier = 1
+        while isinstance(field_type, (GraphQLList, GraphQLNonNull)):
+            if isinstance(field_type, GraphQLList):
+                if name == 'result' and parent_type.name.endswith('Paginated'):
+                    multiplier *= self.page_size
+                else:
+                    multiplier *= self.list_size
+            field_type = field_type.of_type
+        return multiplier
+
+    def get_selection_cost(self, parent_type, selection_set, depth, fragments):
+        if selection_set is None:
+            return 0
+
+        self.depth = max(self.depth, depth)
+        cost = 0
+
+        for selection in selection_set.selections:
+            if isinstance(selection, ast.Field):
+                name = selection.name.value
+                field = getattr(parent_type, 'fields', {}).get(name)
+                if depth == 1:
+                    self.root_fields.add(name)
+                if name.startswith('__') or field is None or selection.selection_set is None:
+                    continue
+                self.type_names.add(get_named_type(field.type).name)
+                cost += 1 + self.get_multiplier(parent_type, name, field.type) * self.get_selection_cost(
+                    get_named_type(field.type), selection.selection_set, depth + 1, fragments
+                )
+
+            elif isinstance(selection, ast.FragmentSpread):
+                name = selection.name.value
+                fragment = self.fragments.get(name)
+                if fragment is None or name in fragments:
+                    continue
+                fragment_type = self.schema.get_type(fragment.type_condition.name.value) or parent_type
+                cost += self.get_selection_cost(fragment_type, fragment.selection_set, depth, fragments + (name,))
+
+            elif isinstance(selection, ast.InlineFragment):
+                fragment_type = parent_type
+                if selection.type_condition:
+                    fragment_type = self.schema.get_type(selection.type_condition.name.value) or parent_type
+                cost += self.get_selection_cost(fragment_type, selection.selection_set, depth, fragments)
+
+        return cost
+
+    @property
+    def maximum_cost(self):
+        return settings.GRAPHENE.get('MAX_QUERY_COST', 5000)
+
+    @property
+    def maximum_depth(self):
+        return settings.GRAPHENE.get('MAX_QUERY_DEPTH', 10)
+
+    @property
+    def report(self):
+        return {
+            'requested': self.cost,
+            'maximum': self.maximum_cost,
+            'depth': self.depth,
+            'maximum_depth': self.maximum_depth,
+        }
+
+    @property
+    def error(self):
+        """Error message when the operation is over MAX_QUERY_COST or MAX_QUERY_DEPTH"""
+        if self.cost > self.maximum_cost:
+            return f'Query cost {self.cost} exceeds the maximum cost {self.maximum_cost}!'
+        if self.depth > self.maximum_depth:
+            return f'Query depth {self.depth} exceeds the maximum depth {self.maximum_depth}!'
+        return None
@@ -0,0 +1,69 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import partial
+
+from django.conf import settings
+from graphql.backend.core import GraphQLCoreBackend
+from graphql.backend.base import GraphQLDocument
+from graphql.execution import ExecutionResult, execute
+from graphql.language.base import parse
+from graphql.validation import validate
+
+
+def execute_validated(schema, document_ast, validation_errors, *args, **kwargs):
+    """Execute the document validated in advance"""
+    if validation_errors:
+        return ExecutionResult(errors=validation_errors, invalid=True)
+
+    return execute(schema, document_ast, *args, **kwargs)
+
+
+class CachedDocument(GraphQLDocument):
+    """Parsed and validated document with the cost reports of its operations"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cost_reports = {}
+
+
+class DocumentCacheBackend(GraphQLCoreBackend):
+    """
+    Backend keeping an LRU of parsed and validated documents by the sha256 of the query,
+    so repeated operations skip parsing and validation
+    """
+
+    def __init__(self, size=None, executor=None):
+        super().__init__(executor=executor)
+        self.size = size or settings.GRAPHENE.get('DOCUMENT_CACHE_SIZE', 500)
+        self.documents = OrderedDict()
+        self.lock = threading.Lock()
+
+    def document_from_string(self, schema, document_string):
+        key = (id(schema), hashlib.sha256(document_string.encode()).hexdigest())
+
+        with self.lock:
+            document = self.documents.get(key)
+            if document is not None:
+                self.documents.move_to_end(key)
+                return document
+
+        document_ast = parse(document_string)
+        document = CachedDocument(
+            schema=schema,
+            document_string=document_string,
+            document_ast=document_ast,
+            execute=partial(
+                execute_validated, schema, document_ast, validate(schema, document_ast), **self.execute_params
+            ),
+        )
+
+        with self.lock:
+            self.documents[key] = document
+            while len(self.documents) > self.size:
+                self.documents.popitem(last=False)
+
+        return document
+
+
+document_backend = DocumentCacheBackend()
@@ -0,0 +1,98 @@
+from collections import defaultdict
+
+from django.db.models import F, ForeignObjectRel
+from graphene_django import DjangoObjectType
+from promise import Promise
+from promise.dataloader import DataLoader
+
+from .optimizer import get_model_fields
+
+
+class RelationLoader(DataLoader):
+    """
+    Loads rows of the model by the values of the lookup in one query per batch,
+    as a list per key when many=True or as a single row (or None) otherwise
+    """
+
+    def __init__(self, model, lookup, many):
+        super().__init__()
+        self.model = model
+        self.lookup = lookup
+        self.many = many
+
+    def batch_load_fn(self, keys):
+        rows = defaultdict(list)
+        queryset = self.model._default_manager.filter(
+            **{f'{self.lookup}__in': keys}
+        ).annotate(_loader_key=F(self.lookup))
+
+        for row in queryset:
+            rows[row._loader_key].append(row)
+
+        if self.many:
+            return Promise.resolve([rows.get(key, []) for key in keys])
+
+        return Promise.resolve([rows[key][0] if rows.get(key) else None for key in keys])
+
+
+def get_loader(info, model, lookup, many):
+    """DataLoader of the current request, None without a request context"""
+    if info.context is None:
+        return None
+
+    if not hasattr(info.context, 'dataloaders'):
+        info.context.dataloaders = {}
+
+    key = (model, lookup, many)
+    if key not in info.context.dataloaders:
+        info.context.dataloaders[key] = RelationLoader(model, lookup, many)
+
+    return info.context.dataloaders[key]
+
+
+def get_relation_resolver(name, field):
+    """Resolver of the relation field using the prefetched data or a DataLoader"""
+
+    if field.many_to_many or field.one_to_many:
+        lookup = field.field.name if isinstance(field, ForeignObjectRel) else field.related_query_name()
+
+        def resolver(root, info, **kwargs):
+            loader = get_loader(info, field.related_model, lookup, True)
+            if loader is None or name in getattr(root, '_prefetched_objects_cache', {}):
+                return getattr(root, name)
+            return loader.load(root.pk)
+
+    elif isinstance(field, ForeignObjectRel):
+        def resolver(root, info, **kwargs):
+            loader = get_loader(info, field.related_model, field.field.name, False)
+            if loader is None or field.is_cached(root):
+                return getattr(root, name, None)
+            return loader.load(root.pk)
+
+    else:
+        def resolver(root, info, **kwargs):
+            loader = get_loader(info, field.related_model, field.target_field.name, False)
+            key = getattr(root, field.attname)
+            if loader is None or key is None or field.is_cached(root):
+                return getattr(root, name)
+            return loader.load(key)
+
+    return resolver
+
+
+class BatchedObjectType(DjangoObjectType):
+    """
+    DjangoObjectType resolving the relation fields of the model by per-request
+    DataLoaders, unless the relation was already loaded by select/prefetch_related
+    """
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def __init_subclass_with_meta__(cls, model=None, **options):
+        super().__init_subclass_with_meta__(model=model, **options)
+
+        for name, field in get_model_fields(model).items():
+            if field.is_relation and name in cls._meta.fields and not hasattr(cls, f'resolve_{name}'):
+                setattr(cls, f'resolve_{name}', staticmethod(get_relation_resolver(name, field)))
@@ -0,0 +1,81 @@
+from contextlib import contextmanager
+from decimal import Decimal, InvalidOperation
+
+import graphene
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, models, transaction
+
+
+@contextmanager
+def unique_violation(duplicates, message):
+    """
+    Run the insert or update of the block in a savepoint, raising the message instead of the
+    IntegrityError when the duplicates queryset finds the row it collided with. The unique
+    constraint closes the window a check before the write leaves open, and saves its query
+    """
+    try:
+        with transaction.atomic():
+            yield
+    except IntegrityError:
+        if duplicates.exists():
+            raise Exception(message)
+        raise
+
+
+def quantize_decimal(field, value):
+    """
+    The value stored with the decimal places of the field, returned like a loaded row. A value
+    the max_digits of the column can't store raises the field error instead of the database one
+    """
+    digits = field.max_digits - field.decimal_places
+    try:
+        value = field.to_python(value).quantize(Decimal(1).scaleb(-field.decimal_places))
+    except (ValidationError, InvalidOperation):
+        # Quantizing past the precision of the context fails the same way
+        value = None
+    if value is None or not value.is_finite() or value.adjusted() >= digits:
+        raise Exception(f"{field.name} must be a number with at most {digits} digits before the decimal point!")
+    return value
+
+
+class UpdateMutation(graphene.Mutation):
+    """
+    Mutation updating a row owned by the user in one or two queries: the row is loaded
+    once and locked by get_for_update(), save_changes() applies the input in memory and
+    saves only the changed fields. Both run in the transaction of the mutation
+    """
+
+    class Meta:
+        abstract = True
+
+    @staticmethod
+    def get_for_update(queryset, message):
+        """The row of the queryset locked until the end of the transaction, the message is raised without it"""
+        instance = queryset.select_for_update().first()
+        if instance is None:
+            raise Exception(message)
+        return instance
+
+    @staticmethod
+    def save_changes(instance, changes, **kwargs):
+        """
+        Set the changed values on the instance and save only their fields with
+        the keyword arguments of save(), returns the changed fields
+        """
+        fields = []
+        for name, value in changes.items():
+            field = instance._meta.get_field(name)
+            if isinstance(field, models.DecimalField) and value is not None:
+                value = quantize_decimal(field, value)
+            current = getattr(instance, field.attname)
+            if current != (value.pk if isinstance(value, models.Model) else value):
+                setattr(instance, name, value)
+                fields.append(field.attname)
+
+        if fields:
+            # auto_now dates are only saved when they are listed
+            auto_now = [
+                field.attname for field in instance._meta.concrete_fields if getattr(field, 'auto_now', False)
+            ]
+            instance.save(update_fields=fields + auto_now, **kwargs)
+        return fields
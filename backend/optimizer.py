@@ -0,0 +1,113 @@
+from django.db.models import ForeignObjectRel, Prefetch, QuerySet
+from graphene.utils.str_converters import to_snake_case
+from graphql.language import ast
+
+
+def collect_fields(info, nodes):
+    """
+    Fields selected in the selection sets of the nodes with expanded fragments,
+    returns snake_case field name -> list of the field nodes.
+    """
+    fields = {}
+    for node in nodes:
+        if not node.selection_set:
+            continue
+        for selection in node.selection_set.selections:
+            if isinstance(selection, ast.Field):
+                fields.setdefault(to_snake_case(selection.name.value), []).append(selection)
+            elif isinstance(selection, ast.FragmentSpread):
+                fragment = info.fragments[selection.name.value]
+                for name, field_nodes in collect_fields(info, [fragment]).items():
+                    fields.setdefault(name, []).extend(field_nodes)
+            elif isinstance(selection, ast.InlineFragment):
+                for name, field_nodes in collect_fields(info, [selection]).items():
+                    fields.setdefault(name, []).extend(field_nodes)
+    return fields
+
+
+class QueryPlan:
+    """Columns and relations a queryset has to load for the selected fields"""
+
+    def __init__(self):
+        self.only = set()
+        self.select_related = set()
+        self.prefetch_related = []
+
+    def apply(self, queryset):
+        if self.select_related:
+            queryset = queryset.select_related(*sorted(self.select_related))
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.prefetch_related)
+        if self.only is not None:
+            queryset = queryset.only(*sorted(self.only))
+        return queryset
+
+
+def get_model_fields(model):
+    """Model fields and reverse relations by the names DjangoObjectType exposes them"""
+    fields = {}
+    for field in model._meta.get_fields():
+        if isinstance(field, ForeignObjectRel):
+            name = field.get_accessor_name()
+            if name:
+                fields[name] = field
+        else:
+            fields[field.name] = field
+    return fields
+
+
+def plan_model(info, model, nodes, plan, prefix=''):
+    """Fill the plan with the fields selected in the nodes for the model"""
+    fields = get_model_fields(model)
+    if plan.only is not None:
+        plan.only.add(prefix + model._meta.pk.name)
+
+    for name, field_nodes in collect_fields(info, nodes).items():
+        if name.startswith('__'):
+            continue
+
+        field = fields.get(name)
+
+        if field is None:
+            # Resolved by custom code, which may read any column
+            plan.only = None
+
+        elif not field.is_relation:
+            if plan.only is not None:
+                plan.only.add(prefix + name)
+
+        elif field.many_to_one or field.one_to_one:
+            if field.concrete and plan.only is not None:
+                plan.only.add(prefix + name)
+            plan.select_related.add(prefix + name)
+            plan_model(info, field.related_model, field_nodes, plan, f'{prefix}{name}__')
+
+        elif field.one_to_many or field.many_to_many:
+            required = [field.field.name] if field.one_to_many else []
+            queryset = optimize_queryset(
+                field.related_model._default_manager.all(), info, field_nodes, required
+            )
+            plan.prefetch_related.append(Prefetch(prefix + name, queryset=queryset))
+
+
+def optimize_queryset(queryset, info, field_nodes=None, required=()):
+    """
+    Derive the select_related/prefetch_related/only() plan of the queryset from
+    the GraphQL selection set, by default of the resolving field.
+    Fields in `required` and the ordering fields are always loaded.
+    """
+    if not isinstance(queryset, QuerySet):
+        return queryset
+
+    if field_nodes is None:
+        field_nodes = info.field_asts
+
+    plan = QueryPlan()
+    plan_model(info, queryset.model, field_nodes, plan)
+
+    if plan.only is not None:
+        local_fields = {field.name for field in queryset.model._meta.concrete_fields}
+        ordering = [key.lstrip('-') for key in queryset.query.order_by if isinstance(key, str)]
+        plan.only.update(name for name in [*required, *ordering] if name in local_fields)
+
+    return plan.apply(queryset)
@@ -1,9 +1,21 @@
+import base64
+import datetime
+import json
+import math
 import re
+from decimal import Decimal, InvalidOperation
+from functools import partial, reduce
 
 import graphene
 from django.conf import settings
-from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.core.exceptions import EmptyResultSet
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
 from django.db.models import Q
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .cache import get_or_set, get_queryset_tags, make_key
+from .optimizer import collect_fields, optimize_queryset
 
 
 def is_authenticated(function):
@@ -18,50 +30,312 @@ def is_authenticated(function):
     return wrapper
 
 
-def paginate(model_type):
-    """Create pagination query"""
+def get_selected_fields(info):
+    """Names of the fields the client selected in the resolving field"""
+    return set(collect_fields(info, info.field_asts))
+
+
+# Fields of the paginated type which can't be answered without the COUNT query
+COUNT_FIELDS = {'pages', 'total_data', 'is_estimated'}
+
+
+def paginate(model_type, cursor=False, fields=None):
+    """
+    Create pagination query, with start/end cursors when cursor=True
+    and the extra fields resolved from the paginated result
+    """
 
     structure = {
         'page': graphene.Int(),
         'pages': graphene.Int(),
         'total_data': graphene.Int(),
+        'is_estimated': graphene.Boolean(),
         'has_next': graphene.Boolean(),
         'has_previous': graphene.Boolean(),
         'result': graphene.List(model_type)
     }
 
+    if cursor:
+        structure.update({
+            'start_cursor': graphene.String(),
+            'end_cursor': graphene.String(),
+        })
+
+    structure.update(fields or {})
+
     return type(f'{model_type}Paginated', (graphene.ObjectType,), structure)
 
 
+def get_planner_estimate(qs):
+    """Number of rows of the queryset estimated by the PostgreSQL planner"""
+    sql, params = qs.query.sql_with_params()
+    with connections[qs.db].cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        return int(cursor.fetchone()[0][0]['Plan']['Plan Rows'])
+
+
+def get_count(qs):
+    """
+    Count of the queryset and is it estimated. With the COUNT_ESTIMATE_THRESHOLD
+    setting counting stops after the threshold and bigger sets are estimated.
+    """
+    threshold = settings.GRAPHENE.get('COUNT_ESTIMATE_THRESHOLD')
+    if threshold is None:
+        return qs.count(), False
+
+    count = qs[:threshold + 1].count()
+    if count <= threshold:
+        return count, False
+
+    if connections[qs.db].vendor == 'postgresql':
+        return max(get_planner_estimate(qs), count), True
+
+    return count, True
+
+
+def count_queryset(qs):
+    """
+    Count of the queryset cached by its SQL for COUNT_CACHE_TIMEOUT seconds,
+    the cache is invalidated by the changes of every model the query reads.
+    """
+    qs = qs.order_by()
+    try:
+        sql, params = qs.query.sql_with_params()
+    except EmptyResultSet:
+        return 0, False
+
+    return get_or_set(
+        make_key('count', qs.db, sql, params),
+        partial(get_count, qs),
+        tags=get_queryset_tags(qs),
+        timeout=settings.GRAPHENE.get('COUNT_CACHE_TIMEOUT', 60)
+    )
+
+
+def is_cursor_paginated(paginated_type):
+    """Check that the paginated type was created with paginate(..., cursor=True)"""
+    return 'end_cursor' in paginated_type.graphene_type._meta.fields
+
+
+def get_cursor_ordering(qs):
+    """Ordering of the queryset made stable by the primary key as the last key"""
+    ordering = list(qs.query.order_by or qs.model._meta.ordering)
+
+    for key in ordering:
+        if not isinstance(key, str):
+            raise Exception("Cursor pagination supports only ordering by field names!")
+
+    if not any(key.lstrip('-') in ('pk', qs.model._meta.pk.name) for key in ordering):
+        ordering.append('-pk' if ordering and ordering[-1].startswith('-') else 'pk')
+
+    return ordering
+
+
+def get_cursor_value(obj, key):
+    """Value of the ordering key on the object, following `__` lookups"""
+    name = key.lstrip('-')
+    if '__' not in name and name != 'pk':
+        try:
+            name = obj._meta.get_field(name).attname
+        except Exception:
+            pass
+    return reduce(getattr, name.split('__'), obj)
+
+
+# Types of the cursor values which JSON can't keep, by their tag in the cursor
+CURSOR_TYPES = {
+    'datetime': (datetime.datetime, parse_datetime),
+    'date': (datetime.date, parse_date),
+    'decimal': (Decimal, Decimal),
+}
+
+
+def encode_cursor_value(value):
+    """JSON value of a cursor key, datetimes keep their microseconds to match the stored rows"""
+    for tag, (kind, _) in CURSOR_TYPES.items():
+        if isinstance(value, kind):
+            return {tag: str(value) if tag == 'decimal' else value.isoformat()}
+    return value
+
+
+def decode_cursor_value(value):
+    if isinstance(value, dict):
+        if len(value) != 1 or next(iter(value)) not in CURSOR_TYPES:
+            raise Exception("Invalid cursor!")
+        tag, text = next(iter(value.items()))
+        try:
+            value = CURSOR_TYPES[tag][1](text)
+        except (TypeError, ValueError, InvalidOperation):
+            value = None
+        if value is None:
+            raise Exception("Invalid cursor!")
+    return value
+
+
+def encode_cursor(obj, ordering):
+    values = [encode_cursor_value(get_cursor_value(obj, key)) for key in ordering]
+    data = json.dumps(values, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode()
+
+
+def decode_cursor(cursor, ordering):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except Exception:
+        raise Exception("Invalid cursor!")
+
+    if not isinstance(values, list) or len(values) != len(ordering):
+        raise Exception("Invalid cursor!")
+
+    return [decode_cursor_value(value) for value in values]
+
+
+def get_keyset_query(ordering, values, backwards=False):
+    """
+    Build the condition selecting rows placed after the cursor values
+    (or before them when backwards=True) in the given ordering:
+    (a > x) OR (a = x AND b > y) OR ...
+    """
+    query = Q()
+    for index, key in enumerate(ordering):
+        descending = key.startswith('-') != backwards
+        condition = Q(**{f"{key.lstrip('-')}__{'lt' if descending else 'gt'}": values[index]})
+        for previous_key, previous_value in zip(ordering[:index], values[:index]):
+            condition &= Q(**{previous_key.lstrip('-'): previous_value})
+        query |= condition
+    return query
+
+
+def reverse_ordering(ordering):
+    return [key[1:] if key.startswith('-') else f'-{key}' for key in ordering]
+
+
+def resolve_cursor_paginated(query_data, info, after=None, before=None):
+    """Paginated data by the keyset of the `after`/`before` cursors"""
+
+    page_size = settings.GRAPHENE.get('PAGE_SIZE', 10)
+    ordering = get_cursor_ordering(query_data)
+    qs = query_data.order_by(*ordering)
+
+    if before:
+        values = decode_cursor(before, ordering)
+        rows = list(
+            qs.filter(get_keyset_query(ordering, values, backwards=True))
+              .order_by(*reverse_ordering(ordering))[:page_size + 1]
+        )
+        has_previous = len(rows) > page_size
+        has_next = True
+        rows = rows[:page_size][::-1]
+    else:
+        values = decode_cursor(after, ordering)
+        rows = list(qs.filter(get_keyset_query(ordering, values))[:page_size + 1])
+        has_next = len(rows) > page_size
+        has_previous = True
+        rows = rows[:page_size]
+
+    result = info.return_type.graphene_type(
+        has_next=has_next,
+        has_previous=has_previous,
+        start_cursor=encode_cursor(rows[0], ordering) if rows else None,
+        end_cursor=encode_cursor(rows[-1], ordering) if rows else None,
+        result=rows
+    )
+
+    if get_selected_fields(info) & COUNT_FIELDS:
+        total_data, is_estimated = count_queryset(qs)
+        result.pages = max(math.ceil(total_data / page_size), 1)
+        result.total_data = total_data
+        result.is_estimated = is_estimated
+
+    return result
+
+
 def resolve_paginated(query_data, info, page_info):
     """Paginated data"""
 
     def get_paginated_data(qs, paginated_type, page):
         page_size = settings.GRAPHENE.get('PAGE_SIZE', 10)
 
-        p = Paginator(qs, page_size)
+        cursor = is_cursor_paginated(paginated_type)
+        if cursor:
+            ordering = get_cursor_ordering(qs)
+            qs = qs.order_by(*ordering)
 
         try:
-            page_obj = p.page(page)
-        except PageNotAnInteger:
-            page_obj = p.page(1)
-        except EmptyPage:
-            page_obj = p.page(p.num_pages)
+            number = max(int(page), 1)
+        except (TypeError, ValueError):
+            number = 1
+
+        totals = {}
+        if get_selected_fields(info) & COUNT_FIELDS:
+            total_data, is_estimated = count_queryset(qs)
+            pages = max(math.ceil(total_data / page_size), 1)
+            totals = dict(pages=pages, total_data=total_data, is_estimated=is_estimated)
+            # Pages past an exact count show the last page, an estimate only describes the data
+            if not is_estimated:
+                number = min(number, pages)
+
+        # One more row of the page tells is there a next page
+        offset = (number - 1) * page_size
+        rows = list(qs[offset:offset + page_size + 1])
 
         result = paginated_type.graphene_type(
-            page=page_obj.number,
-            pages=p.num_pages,
-            total_data=qs.count(),
-            has_next=page_obj.has_next(),
-            has_previous=page_obj.has_previous(),
-            result=page_obj.object_list
+            page=number,
+            has_next=len(rows) > page_size,
+            has_previous=number > 1,
+            result=rows[:page_size],
+            **totals
         )
 
+        if cursor:
+            rows = list(result.result)
+            result.start_cursor = encode_cursor(rows[0], ordering) if rows else None
+            result.end_cursor = encode_cursor(rows[-1], ordering) if rows else None
+
         return result
 
     return get_paginated_data(query_data, info.return_type, page_info)
 
 
+class PaginatedField(graphene.Field):
+    """
+    Field of the paginated model type. The pagination resolver is attached to the
+    field when the schema is built, so only paginated fields pay for it.
+    """
+
+    def __init__(self, model_type, cursor=False, fields=None, **kwargs):
+        kwargs.setdefault('page', graphene.Int())
+        if cursor:
+            kwargs.setdefault('after', graphene.String())
+            kwargs.setdefault('before', graphene.String())
+
+        super().__init__(paginate(model_type, cursor=cursor, fields=fields), **kwargs)
+
+    def get_resolver(self, parent_resolver):
+        return partial(self.paginated_resolver, super().get_resolver(parent_resolver))
+
+    @staticmethod
+    def paginated_resolver(resolver, root, info, page=1, after=None, before=None, **kwargs):
+        queryset = resolver(root, info, **kwargs)
+        query_data = optimize_queryset(
+            queryset, info, collect_fields(info, info.field_asts).get('result', [])
+        )
+
+        if after or before:
+            result = resolve_cursor_paginated(query_data=query_data, info=info, after=after, before=before)
+        else:
+            result = resolve_paginated(query_data=query_data, info=info, page_info=page)
+
+        # Extra fields of the paginated type work on the whole filtered queryset
+        result.queryset = queryset
+        return result
+
+
+def resolve_queryset(root, info, **kwargs):
+    """Resolver of an extra paginated field with the filtered queryset of the page as the root"""
+    return root.queryset
+
+
 def normalize_query(query_string, findterms=re.compile(r'"([^"]+)"|(\S+)').findall,
                     normspace=re.compile(r'\s{2,}').sub):
     return [normspace(' ', (t[0] or t[1]).strip()) for t in findterms(query_string)]
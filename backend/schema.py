@@ -1,14 +1,15 @@
 import graphene
 
+from order.schema import schema as order_schema
 from product.schema import schema as product_schema
 from user.schema import schema as user_schema
 
 
-class Query(product_schema.Query, user_schema.Query, graphene.ObjectType):
+class Query(product_schema.Query, user_schema.Query, order_schema.Query, graphene.ObjectType):
     pass
 
 
-class Mutation(product_schema.Mutation, user_schema.Mutation, graphene.ObjectType):
+class Mutation(product_schema.Mutation, user_schema.Mutation, order_schema.Mutation, graphene.ObjectType):
     pass
 
 
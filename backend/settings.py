@@ -51,6 +51,7 @@ INSTALLED_APPS = [
     # Local apps
     'user.apps.UserConfig',
     'product.apps.ProductConfig',
+    'order.apps.OrderConfig',
 ]
 
 AUTH_USER_MODEL = 'user.User'
@@ -95,6 +96,41 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+# The cache tag versions invalidate the caches and the suggestion indexes of every
+# process only with a shared backend like Memcached or Redis, LocMemCache is per process
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Search engine of the products query: product.search.SQLiteSearchBackend,
+# product.search.PostgresSearchBackend or product.search.ContainsSearchBackend,
+# `manage.py rebuild_search_index` creates the index of the first two
+
+PRODUCT_SEARCH_BACKEND = 'product.search.SQLiteSearchBackend'
+
+# Bounds of the sale price buckets counted by the facets of the products query
+
+PRODUCT_PRICE_BUCKETS = [0, 50, 100, 250, 500, 1000]
+
+# Bayesian rating score of sub-products: the average rating as if every sub-product
+# had PRODUCT_RATING_PRIOR_COUNT more comments rated PRODUCT_RATING_PRIOR_MEAN
+
+PRODUCT_RATING_PRIOR_COUNT = 10
+PRODUCT_RATING_PRIOR_MEAN = 3.0
+
+# Rows of the catalog import per transaction and bulk insert
+
+PRODUCT_IMPORT_BATCH_SIZE = 1000
+
+# Seconds a stock reservation holds its units before the sweeper gives them back
+
+STOCK_RESERVATION_TIMEOUT = 15 * 60
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -147,8 +183,24 @@ GRAPHENE = {
     'SCHEMA': 'backend.schema.schema',
     'MIDDLEWARE': [
         'graphql_jwt.middleware.JSONWebTokenMiddleware',
-        'backend.middlewares.CustomPaginationMiddleware'
     ],
+    # Seconds to keep counts of the paginated queries
+    'COUNT_CACHE_TIMEOUT': 60,
+    # Count rows up to the threshold and estimate bigger sets, None - exact counts
+    'COUNT_ESTIMATE_THRESHOLD': None,
+    # Static cost limits of an operation, list fields multiply the cost
+    # of their selections by LIST_COST_MULTIPLIER (paginated results by PAGE_SIZE)
+    'MAX_QUERY_COST': 5000,
+    'MAX_QUERY_DEPTH': 10,
+    'LIST_COST_MULTIPLIER': 10,
+    # Number of parsed and validated documents kept in memory
+    'DOCUMENT_CACHE_SIZE': 500,
+    # Seconds to keep automatic persisted queries, None - until evicted
+    'PERSISTED_QUERY_TIMEOUT': None,
+    # Anonymous queries selecting only these root fields share cached responses,
+    # outdated by the changes of the selected models
+    'RESPONSE_CACHE_FIELDS': ['brands', 'categories', 'types', 'product', 'products'],
+    'RESPONSE_CACHE_TIMEOUT': 300,
 }
 
 AUTHENTICATION_BACKENDS = [
@@ -19,11 +19,11 @@ from django.contrib import admin
 from django.urls import path
 from django.views.decorators.csrf import csrf_exempt
 
-from graphene_file_upload.django import FileUploadGraphQLView
+from .views import GraphQLView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('graphql', csrf_exempt(FileUploadGraphQLView.as_view(graphiql=True, )))
+    path('graphql', csrf_exempt(GraphQLView.as_view(graphiql=True, )))
 ]
 
 if settings.DEBUG:
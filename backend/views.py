@@ -0,0 +1,137 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseBadRequest
+from graphene_django.views import HttpError
+from graphene_file_upload.django import FileUploadGraphQLView
+from graphql import GraphQLError
+from graphql.execution import ExecutionResult
+from graphql_jwt.utils import get_credentials
+
+from .cache import get_model_tag, get_versioned_key, make_key
+from .cost import QueryCost
+from .documents import document_backend
+
+
+class GraphQLView(FileUploadGraphQLView):
+    """
+    GraphQL endpoint with cached documents, automatic persisted queries,
+    rejection of too expensive operations before the execution
+    and cached responses of the public queries
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('backend', document_backend)
+        super().__init__(*args, **kwargs)
+
+    def get_graphql_params(self, request, data):
+        query, variables, operation_name, id = super().get_graphql_params(request, data)
+
+        extensions = request.GET.get('extensions') or data.get('extensions')
+        if extensions and isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except Exception:
+                raise HttpError(HttpResponseBadRequest('Extensions are invalid JSON.'))
+
+        persisted_query = (extensions or {}).get('persistedQuery')
+        if persisted_query:
+            query = self.get_persisted_query(query, persisted_query)
+
+        return query, variables, operation_name, id
+
+    @staticmethod
+    def get_persisted_query(query, persisted_query):
+        """
+        Automatic persisted queries: the client sends the sha256 of the query
+        and the full query only when the server doesn't know the hash yet
+        """
+        query_hash = persisted_query.get('sha256Hash')
+        if not isinstance(query_hash, str):
+            raise HttpError(HttpResponseBadRequest('Persisted query requires sha256Hash.'))
+
+        key = f'persisted-query:{query_hash}'
+
+        if not query:
+            query = cache.get(key)
+            if query is None:
+                raise HttpError(HttpResponse(status=200), 'PersistedQueryNotFound')
+            return query
+
+        if hashlib.sha256(query.encode()).hexdigest() != query_hash:
+            raise HttpError(HttpResponseBadRequest('Provided sha256Hash does not match the query.'))
+
+        cache.set(key, query, settings.GRAPHENE.get('PERSISTED_QUERY_TIMEOUT'))
+        return query
+
+    def execute_graphql_request(self, request, data, query, variables, operation_name, show_graphiql=False):
+        if not query:
+            return super().execute_graphql_request(
+                request, data, query, variables, operation_name, show_graphiql
+            )
+
+        try:
+            document = self.get_backend(request).document_from_string(self.schema, query)
+        except Exception:
+            document = None
+
+        key = None
+        if document is not None:
+            reports = getattr(document, 'cost_reports', {})
+            if operation_name not in reports:
+                reports[operation_name] = QueryCost(self.schema, document.document_ast, operation_name)
+
+            query_cost = reports[operation_name]
+            request.graphql_extensions = {'cost': query_cost.report}
+            if query_cost.error:
+                return ExecutionResult(errors=[GraphQLError(query_cost.error)], invalid=True)
+
+            if self.is_response_cacheable(request, query_cost):
+                key = get_versioned_key(
+                    make_key('response', query, operation_name, variables),
+                    self.get_response_tags(query_cost),
+                )
+                cached = cache.get(key)
+                if cached is not None:
+                    return ExecutionResult(data=cached)
+
+        result = super().execute_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+
+        if key is not None and result is not None and not result.errors:
+            cache.set(key, result.data, settings.GRAPHENE.get('RESPONSE_CACHE_TIMEOUT', 300))
+
+        return result
+
+    @staticmethod
+    def is_response_cacheable(request, query_cost):
+        """Only anonymous queries of the public root fields share the cached responses"""
+        fields = settings.GRAPHENE.get('RESPONSE_CACHE_FIELDS', ())
+        if not fields or query_cost.operation is None or query_cost.operation.operation != 'query':
+            return False
+
+        if not query_cost.root_fields or not query_cost.root_fields.issubset(fields):
+            return False
+
+        user = getattr(request, 'user', None)
+        return not get_credentials(request) and not (user and user.is_authenticated)
+
+    def get_response_tags(self, query_cost):
+        """Tags of the models behind the object types selected by the operation"""
+        tags = set()
+        for name in query_cost.type_names:
+            graphene_type = getattr(self.schema.get_type(name), 'graphene_type', None)
+            model = getattr(getattr(graphene_type, '_meta', None), 'model', None)
+            if model is not None:
+                tags.add(get_model_tag(model))
+        return sorted(tags)
+
+    def json_encode(self, request, d, pretty=False):
+        extensions = getattr(request, 'graphql_extensions', None)
+        if extensions:
+            d = dict(d, extensions=extensions)
+
+        return super().json_encode(request, d, pretty)
@@ -0,0 +1,78 @@
+from collections import Counter
+from decimal import Decimal
+
+from django.db import transaction
+
+from product.models import SubProduct
+from product.reservations import move_units, move_units_in_stock
+from .models import Order, OrderLine
+
+CENT = Decimal('0.01')
+
+
+def get_unit_price(sale_price, discount):
+    """Sale price with the discount in percents, rounded to cents"""
+    discount = min(max(Decimal(str(discount or 0)), Decimal(0)), Decimal(100))
+    return (sale_price * (100 - discount) / 100).quantize(CENT)
+
+
+def get_quantities(items):
+    """Quantities by sub-product id of the (sub_product_id, quantity) pairs, repeated sub-products are summed"""
+    quantities = Counter()
+    for sub_product_id, quantity in items:
+        if quantity < 1:
+            raise Exception("Quantity must be positive!")
+        try:
+            quantities[int(sub_product_id)] += quantity
+        except (TypeError, ValueError):
+            raise Exception(f"Sub-product {sub_product_id} doesn't exist!")
+
+    if not quantities:
+        raise Exception("Order must have lines!")
+    return quantities
+
+
+def place_order(user, items):
+    """
+    Create an order of the user from (sub_product_id, quantity) pairs. The sub-products are
+    checked and priced by one query, then in one short transaction the stocks are taken by
+    conditional UPDATEs and the lines are written by bulk_create. Stocks and products are
+    locked in the order of their ids, so concurrent checkouts can't deadlock
+    """
+    quantities = get_quantities(items)
+
+    sub_products = {
+        row['id']: row for row in SubProduct.objects.filter(
+            id__in=quantities, is_active=True, product__is_active=True
+        ).values('id', 'sku', 'sale_price', 'discount')
+    }
+    missing = [str(pk) for pk in quantities if pk not in sub_products]
+    if missing:
+        raise Exception(f"Sub-products don't exist! Not found: {', '.join(missing)}")
+
+    lines = []
+    for pk in sorted(quantities):
+        row = sub_products[pk]
+        unit_price = get_unit_price(row['sale_price'], row['discount'])
+        lines.append(OrderLine(
+            sub_product_id=pk,
+            sku=row['sku'],
+            quantity=quantities[pk],
+            unit_price=unit_price,
+            discount=row['discount'],
+            price=unit_price * quantities[pk],
+        ))
+
+    with transaction.atomic():
+        deltas = Counter()
+        for line in lines:
+            if not move_units(line.sub_product_id, -line.quantity, units_sold=line.quantity, deltas=deltas):
+                raise Exception(f"Not enough units of {line.sku} in stock!")
+        move_units_in_stock(deltas)
+
+        order = Order.objects.create(user=user, total=sum(line.price for line in lines))
+        for line in lines:
+            line.order = order
+        OrderLine.objects.bulk_create(lines)
+
+    return order
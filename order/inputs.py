@@ -0,0 +1,6 @@
+import graphene
+
+
+class OrderLineInput(graphene.InputObjectType):
+    sub_product_id = graphene.ID(required=True)
+    quantity = graphene.Int(required=True)
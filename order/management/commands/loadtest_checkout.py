@@ -0,0 +1,124 @@
+import random
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Sum
+
+from order.checkout import place_order
+from order.models import OrderLine
+from product.models import Stock, StockShard, SubProduct
+
+
+def get_percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))] if values else 0
+
+
+class Command(BaseCommand):
+    help = (
+        'Place concurrent orders of the same sub-products and check that no stock is oversold '
+        'and the latency stays stable. The orders are really placed, run it on a test database'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', required=True, help='Email of the user placing the orders')
+        parser.add_argument('--sku', action='append', default=[], help='Sku of a sub-product to order, repeatable')
+        parser.add_argument('--orders', type=int, default=500, help='Orders to place')
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent checkouts')
+        parser.add_argument('--lines', type=int, default=2, help='Sub-products per order')
+        parser.add_argument('--quantity', type=int, default=1, help='Units per line')
+
+    def get_stock(self, ids):
+        """Units and units sold by sub-product id, the shards of the stocks included"""
+        stock = {
+            row['sub_product_id']: Counter(units=row['units'], units_sold=row['units_sold'])
+            for row in Stock.objects.filter(sub_product_id__in=ids).values('sub_product_id', 'units', 'units_sold')
+        }
+        shards = StockShard.objects.filter(stock__sub_product_id__in=ids).values('stock__sub_product_id').annotate(
+            shard_units=Sum('units'), shard_units_sold=Sum('units_sold')
+        )
+        for row in shards:
+            stock[row['stock__sub_product_id']].update(
+                units=row['shard_units'], units_sold=row['shard_units_sold']
+            )
+        return stock
+
+    def checkout(self, user, ids, options):
+        lines = [(pk, options['quantity']) for pk in random.sample(ids, min(options['lines'], len(ids)))]
+        started = time.perf_counter()
+        try:
+            order = place_order(user, lines)
+            outcome = order.id
+        except Exception as error:
+            outcome = error
+        finally:
+            # Every worker thread has its own connection
+            connection.close()
+        return started, time.perf_counter() - started, outcome
+
+    def handle(self, *args, **options):
+        if min(options['orders'], options['workers'], options['lines'], options['quantity']) < 1:
+            raise CommandError('Orders, workers, lines and quantity must be positive!')
+        if not options['sku']:
+            raise CommandError('Give the sub-products to order with --sku!')
+
+        user = get_user_model()._default_manager.filter(email=options['user']).first()
+        if user is None:
+            raise CommandError(f"User {options['user']} doesn't exist!")
+
+        ids = list(SubProduct.objects.filter(sku__in=options['sku']).values_list('id', flat=True))
+        if not ids:
+            raise CommandError('No sub-product has the given skus!')
+
+        before = self.get_stock(ids)
+        with ThreadPoolExecutor(options['workers']) as executor:
+            results = list(executor.map(
+                lambda _: self.checkout(user, ids, options), range(options['orders'])
+            ))
+        after = self.get_stock(ids)
+
+        order_ids = [outcome for started, latency, outcome in results if isinstance(outcome, int)]
+        failures = Counter(str(outcome) for started, latency, outcome in results if not isinstance(outcome, int))
+        ordered = Counter(dict(
+            OrderLine.objects.filter(order_id__in=order_ids).values('sub_product_id').annotate(
+                units=Sum('quantity')
+            ).values_list('sub_product_id', 'units')
+        ))
+
+        self.stdout.write(f'{len(order_ids)} orders placed, {sum(failures.values())} failed')
+        for message, count in failures.most_common():
+            self.stdout.write(f'  {count} x {message}')
+
+        oversold = []
+        for pk in ids:
+            taken = before[pk]['units'] - after[pk]['units']
+            sold = after[pk]['units_sold'] - before[pk]['units_sold']
+            self.stdout.write(
+                f"Sub-product {pk}: {before[pk]['units']} -> {after[pk]['units']} units, "
+                f'{ordered[pk]} ordered, {sold} sold'
+            )
+            if after[pk]['units'] < 0 or taken != ordered[pk] or sold != ordered[pk]:
+                oversold.append(str(pk))
+
+        # Latency of the checkouts by quarters of the run, a stable path keeps them close
+        results.sort(key=lambda result: result[0])
+        quarter = max(1, -(-len(results) // 4))
+        for number, first in enumerate(range(0, len(results), quarter), 1):
+            latencies = [latency * 1000 for started, latency, outcome in results[first:first + quarter]]
+            self.stdout.write(
+                f'Quarter {number}: p50 {get_percentile(latencies, 50):.1f} ms, '
+                f'p95 {get_percentile(latencies, 95):.1f} ms, max {max(latencies):.1f} ms'
+            )
+        latencies = [latency * 1000 for started, latency, outcome in results]
+        self.stdout.write(
+            f'All: p50 {get_percentile(latencies, 50):.1f} ms, p95 {get_percentile(latencies, 95):.1f} ms, '
+            f'p99 {get_percentile(latencies, 99):.1f} ms'
+        )
+
+        if oversold:
+            raise CommandError(f"Stock of sub-products {', '.join(oversold)} doesn't match the orders!")
+        self.stdout.write(self.style.SUCCESS('No stock oversold'))
@@ -0,0 +1,100 @@
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+from product.models import SubProduct
+from user.models import User
+
+
+class Order(models.Model):
+    """
+    Order of a user
+    """
+
+    PLACED = 'P'
+    CANCELLED = 'C'
+    STATUS_CHOICES = (
+        (PLACED, _('Placed')),
+        (CANCELLED, _('Cancelled')),
+    )
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='orders'
+    )
+    status = models.CharField(
+        max_length=1,
+        choices=STATUS_CHOICES,
+        default=PLACED,
+        verbose_name=_('order status')
+    )
+    total = models.DecimalField(
+        max_digits=11,
+        decimal_places=2,
+        verbose_name=_('total price of the lines'),
+        help_text=_('format: maximum price 999.999.999,99')
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        editable=False,
+        verbose_name=_('date order placed'),
+        help_text=_('format: Y-m-d H:M:S'),
+    )
+
+    class Meta:
+        verbose_name = _('order')
+        verbose_name_plural = _('orders')
+        indexes = [
+            models.Index(fields=['user', '-created_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.user}  |  {self.total}  |  {self.get_status_display()}'
+
+
+class OrderLine(models.Model):
+    """
+    A sub-product of an order with the prices it was sold for
+    """
+
+    order = models.ForeignKey(
+        Order,
+        on_delete=models.CASCADE,
+        related_name='lines'
+    )
+    # Kept empty when the sub-product is deleted, the line keeps its sku and prices
+    sub_product = models.ForeignKey(
+        SubProduct,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='order_lines'
+    )
+    sku = models.CharField(
+        max_length=16,
+        verbose_name=_('universal product code')
+    )
+    quantity = models.PositiveIntegerField(
+        verbose_name=_('units ordered'),
+        help_text=_('format: required, min-1')
+    )
+    unit_price = models.DecimalField(
+        max_digits=9,
+        decimal_places=2,
+        verbose_name=_('sale price of a unit with the discount')
+    )
+    discount = models.FloatField(
+        default=0,
+        verbose_name=_('discount of the sub-product, percents')
+    )
+    price = models.DecimalField(
+        max_digits=11,
+        decimal_places=2,
+        verbose_name=_('price of the line')
+    )
+
+    class Meta:
+        verbose_name = _('order line')
+        verbose_name_plural = _('order lines')
+
+    def __str__(self):
+        return f'{self.sku}  |  {self.quantity}  |  {self.price}'
@@ -0,0 +1,38 @@
+import graphene
+
+from backend.permissions import PaginatedField, is_authenticated
+from .checkout import place_order
+from .inputs import OrderLineInput
+from .models import Order
+from .types import OrderType
+
+
+class PlaceOrder(graphene.Mutation):
+    """Placing an order, the units of its lines are taken from the stock."""
+    order = graphene.Field(OrderType)
+    status = graphene.Boolean()
+
+    class Arguments:
+        lines = graphene.List(graphene.NonNull(OrderLineInput), required=True)
+
+    @is_authenticated
+    def mutate(self, info, lines):
+        order = place_order(info.context.user, [(line.sub_product_id, line.quantity) for line in lines])
+
+        return PlaceOrder(order=order, status=True)
+
+
+class Mutation(graphene.ObjectType):
+    place_order = PlaceOrder.Field()
+
+
+class Query(graphene.ObjectType):
+    orders = PaginatedField(OrderType)
+
+    @staticmethod
+    @is_authenticated
+    def resolve_orders(cls, info, **kwargs):
+        return Order.objects.filter(user_id=info.context.user.id).order_by('-created_at', '-id')
+
+
+schema = graphene.Schema(query=Query, mutation=Mutation)
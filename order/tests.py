@@ -0,0 +1,76 @@
+from django.db.models import Sum
+from django.test import TestCase
+
+from product.models import Product, Stock, StockShard, SubProduct
+from product.shards import compact_stock
+from product.tests import seed_catalog
+from .checkout import place_order
+from .models import Order, OrderLine
+
+
+class PlaceOrderTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = seed_catalog(products=2).user
+        cls.first, cls.second, cls.other = SubProduct.objects.order_by('id')[:3]
+        for sub_product in (cls.first, cls.second, cls.other):
+            Stock.objects.create(sub_product=sub_product, units=5)
+
+    def get_stock(self, sub_product):
+        """Units and units sold of the sub-product, its shards included"""
+        stock = Stock.objects.get(sub_product=sub_product)
+        shards = StockShard.objects.filter(stock=stock).aggregate(units=Sum('units'), units_sold=Sum('units_sold'))
+        return stock.units + (shards['units'] or 0), stock.units_sold + (shards['units_sold'] or 0)
+
+    def get_units_in_stock(self, sub_product):
+        return Product.objects.get(id=sub_product.product_id).units_in_stock
+
+    def test_order(self):
+        order = place_order(self.user, [(self.first.id, 2), (self.other.id, 1)])
+
+        lines = {line.sub_product_id: line for line in order.lines.all()}
+        self.assertEqual(lines[self.first.id].quantity, 2)
+        self.assertEqual(lines[self.first.id].price, self.first.sale_price * 2)
+        self.assertEqual(order.total, self.first.sale_price * 2 + self.other.sale_price)
+
+        self.assertEqual(self.get_stock(self.first), (3, 2))
+        self.assertEqual(self.get_stock(self.other), (4, 1))
+        # Both sub-products of the first product count in its units in stock
+        self.assertEqual(self.get_units_in_stock(self.first), 3 + 5)
+        self.assertEqual(self.get_units_in_stock(self.other), 4)
+
+    def test_missing_stock_of_a_line_rolls_back_the_order(self):
+        with self.assertRaisesMessage(Exception, f'Not enough units of {self.second.sku} in stock!'):
+            place_order(self.user, [(self.first.id, 2), (self.second.id, 6)])
+
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderLine.objects.exists())
+        self.assertEqual(self.get_stock(self.first), (5, 0))
+        self.assertEqual(self.get_stock(self.second), (5, 0))
+        self.assertEqual(self.get_units_in_stock(self.first), 10)
+
+    def test_repeated_sub_products_are_merged(self):
+        order = place_order(self.user, [(self.first.id, 1), (str(self.first.id), 2)])
+
+        self.assertEqual(list(order.lines.values_list('sub_product_id', 'quantity')), [(self.first.id, 3)])
+        self.assertEqual(self.get_stock(self.first), (2, 3))
+
+        with self.assertRaisesMessage(Exception, f'Not enough units of {self.first.sku} in stock!'):
+            place_order(self.user, [(self.first.id, 2), (self.first.id, 1)])
+        self.assertEqual(self.get_stock(self.first), (2, 3))
+
+    def test_sharded_stock(self):
+        stock = Stock.objects.get(sub_product=self.first)
+        Stock.objects.filter(id=stock.id).update(shard_count=4, units=10)
+        compact_stock(stock.id)
+
+        for quantity in (3, 4, 2):
+            place_order(self.user, [(self.first.id, quantity)])
+        self.assertEqual(self.get_stock(self.first), (1, 9))
+        self.assertFalse(StockShard.objects.filter(stock=stock, units__lt=0).exists())
+
+        with self.assertRaisesMessage(Exception, f'Not enough units of {self.first.sku} in stock!'):
+            place_order(self.user, [(self.first.id, 2)])
+        self.assertEqual(self.get_stock(self.first), (1, 9))
+        self.assertEqual(Order.objects.count(), 3)
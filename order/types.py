@@ -0,0 +1,15 @@
+from backend.loaders import BatchedObjectType
+
+from .models import Order, OrderLine
+
+
+class OrderType(BatchedObjectType):
+    class Meta:
+        model = Order
+        fields = '__all__'
+
+
+class OrderLineType(BatchedObjectType):
+    class Meta:
+        model = OrderLine
+        fields = '__all__'
@@ -2,10 +2,10 @@ from django.contrib import admin
 
 from .models import (
     Attribute, BusinessCard, Brand, Category,
-    Comment, Type, Product, SubProduct, Stock
+    Comment, Type, Product, SubProduct, Stock, StockReservation, StockShard
 )
 
 admin.site.register(
     (Attribute, BusinessCard, Brand, Category,
-     Comment, Type, Product, SubProduct, Stock,),
+     Comment, Type, Product, SubProduct, Stock, StockReservation, StockShard,),
 )
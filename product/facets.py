@@ -0,0 +1,73 @@
+from functools import partial
+
+from django.conf import settings
+from django.core.exceptions import EmptyResultSet
+from django.db.models import Count, Q
+
+from backend.cache import get_model_tag, get_or_set, get_queryset_tags, make_key
+from .models import Brand, Category, Product, Type
+
+
+def get_cached(name, queryset, function, models):
+    """Facet of the queryset cached by its SQL like the counts of the paginated queries"""
+    products = queryset.order_by().values('pk')
+    try:
+        sql, params = products.query.sql_with_params()
+    except EmptyResultSet:
+        return []
+
+    return get_or_set(
+        make_key(f'facet-{name}', products.db, sql, params),
+        partial(function, products),
+        tags=sorted({*get_queryset_tags(products), *(get_model_tag(model) for model in models)}),
+        timeout=settings.GRAPHENE.get('COUNT_CACHE_TIMEOUT', 60)
+    )
+
+
+def count_related(model, relation, products):
+    """Rows of the model related to the products, annotated with the number of the products"""
+    return list(
+        model.objects.filter(**{f'{relation}__in': products})
+        .annotate(count=Count(relation))
+        .order_by('-count', 'name')
+    )
+
+
+def get_price_buckets():
+    """(min, max) sale price ranges from the PRODUCT_PRICE_BUCKETS bounds, the last one is open"""
+    bounds = getattr(settings, 'PRODUCT_PRICE_BUCKETS', [0, 50, 100, 250, 500, 1000])
+    return list(zip(bounds, [*bounds[1:], None]))
+
+
+def count_price_buckets(products):
+    """Number of the products starting from the price of each bucket, in one aggregate query"""
+    buckets = get_price_buckets()
+    conditions = [
+        Q(min_price__gte=low) & (Q(min_price__lt=high) if high is not None else Q())
+        for low, high in buckets
+    ]
+    counts = Product.objects.filter(pk__in=products, active_sub_products__gt=0).aggregate(**{
+        f'bucket_{index}': Count('pk', filter=condition) for index, condition in enumerate(conditions)
+    })
+    return [
+        {'min_price': low, 'max_price': high, 'count': counts[f'bucket_{index}']}
+        for index, (low, high) in enumerate(buckets)
+    ]
+
+
+def get_brand_facet(queryset):
+    return get_cached('brand', queryset, partial(count_related, Brand, 'product_brands'), [Product, Brand])
+
+
+def get_category_facet(queryset):
+    return get_cached(
+        'category', queryset, partial(count_related, Category, 'product_categories'), [Product, Category]
+    )
+
+
+def get_type_facet(queryset):
+    return get_cached('type', queryset, partial(count_related, Type, 'product_types'), [Product, Type])
+
+
+def get_price_facet(queryset):
+    return get_cached('price', queryset, count_price_buckets, [Product])
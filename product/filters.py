@@ -0,0 +1,94 @@
+from django.db.models import Exists, OuterRef, Q
+
+from .models import BusinessCard, Product, SubProduct, Type
+from .search import get_search_backend
+
+
+def has_brand(value):
+    return Exists(Product.brand.through.objects.filter(product=OuterRef('pk'), brand__name__icontains=value))
+
+
+def has_category(value):
+    return Exists(
+        Product.category.through.objects.filter(product=OuterRef('pk'), category__name__icontains=value)
+    )
+
+
+def has_rating_at_most(value):
+    # Any active sub-product rated at most the value is enough, products keep only their best rating
+    return Exists(SubProduct.objects.filter(product=OuterRef('pk'), is_active=True, avg_rating__lte=value))
+
+
+def has_type(value):
+    return Exists(Type.objects.filter(pk=OuterRef('type_id'), name__icontains=value))
+
+
+def has_business_card(value):
+    return Exists(BusinessCard.objects.filter(pk=OuterRef('card_id'), name__icontains=value))
+
+
+class ProductFilter:
+    """
+    Compiles the arguments of the products query into predicates on the indexed
+    columns of Product and correlated EXISTS subqueries, so every combination
+    of the filters stays one flat query without joins and distinct()
+    """
+
+    filters = {
+        'min_price': lambda value: Q(active_sub_products__gt=0, max_price__gte=value),
+        'max_price': lambda value: Q(active_sub_products__gt=0, min_price__lte=value),
+        'min_rating': lambda value: Q(max_rating__gte=value),
+        'max_rating': has_rating_at_most,
+        'brand': has_brand,
+        'category': has_category,
+        'type_of_product': has_type,
+        'business_card': has_business_card,
+    }
+
+    # Values of sort_by and the indexed columns they order by
+    sort_keys = {
+        'name': 'name',
+        'created_at': 'created_at',
+        'min_price': 'min_price',
+        'max_price': 'max_price',
+        'max_rating': 'max_rating',
+        'best_rated': 'max_rating_score',
+        'units_in_stock': 'units_in_stock',
+        'relevance': 'search_rank',
+    }
+
+    def __init__(self, search=None, sort_by=None, is_asc=False, **kwargs):
+        self.search = search
+        self.sort_by = sort_by
+        self.is_asc = is_asc
+        self.values = {name: value for name, value in kwargs.items() if name in self.filters}
+
+        if sort_by and sort_by not in self.sort_keys:
+            raise Exception(f"Sorting by {sort_by} isn't supported, use one of: {', '.join(self.sort_keys)}!")
+
+        if sort_by == 'relevance' and not search:
+            raise Exception("Sorting by relevance requires a search!")
+
+    def get_conditions(self):
+        return [
+            self.filters[name](value) for name, value in self.values.items()
+            if value is not None and value != ''
+        ]
+
+    def filter(self, queryset):
+        search_backend = get_search_backend()
+
+        if self.search:
+            queryset = search_backend.filter(queryset, self.search)
+
+        conditions = self.get_conditions()
+        if conditions:
+            queryset = queryset.filter(*conditions)
+
+        if self.sort_by:
+            if self.sort_by == 'relevance':
+                queryset = search_backend.annotate_rank(queryset, self.search)
+            key = self.sort_keys[self.sort_by]
+            queryset = queryset.order_by(key if self.is_asc else f'-{key}')
+
+        return queryset
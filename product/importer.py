@@ -0,0 +1,299 @@
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+
+from backend.cache import invalidate_models
+from .models import Attribute, Brand, Category, Product, Stock, SubProduct, Type
+
+# Columns of a row, one row per sub-product, rows with the same name belong to one product
+PRODUCT_FIELDS = ('name', 'description', 'gender')
+SUB_PRODUCT_FIELDS = ('sku', 'retail_price', 'sale_price', 'store_price', 'weight')
+
+
+class RowError(Exception):
+    pass
+
+
+def read_rows(file, format):
+    """Stream (line number, row) pairs of a CSV or JSONL text file"""
+    if format == 'csv':
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield reader.line_num, row
+    elif format == 'jsonl':
+        for line_number, line in enumerate(file, 1):
+            if line.strip():
+                try:
+                    yield line_number, json.loads(line)
+                except ValueError as error:
+                    yield line_number, RowError(f'Invalid JSON: {error}')
+    else:
+        raise Exception(f"Format {format} isn't supported, use csv or jsonl!")
+
+
+def get_format(filename):
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.json', '.ndjson')) else 'csv'
+
+
+def get_text(value, field):
+    """Stripped text of a string or a number, JSONL values of other types raise RowError"""
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list, bool)):
+        raise RowError(f'{field} must be text')
+    return str(value).strip()
+
+
+def get_names(value, field):
+    """Names from a list (JSONL) or a `|` separated string (CSV)"""
+    if isinstance(value, str):
+        value = value.split('|')
+    elif not isinstance(value, (list, type(None))):
+        raise RowError(f'{field} must be a list of names')
+    names = [get_text(name, field) for name in value or []]
+    return [name for name in names if name]
+
+
+def get_number(row, field, type, default=None):
+    value = row.get(field)
+    if value in (None, ''):
+        if default is None:
+            raise RowError(f'{field} is required')
+        return default
+    try:
+        return type(str(value))
+    except (InvalidOperation, ValueError):
+        raise RowError(f'{field} must be a number')
+
+
+def parse_row(row):
+    """Validated values of the row, raises RowError"""
+    if isinstance(row, RowError):
+        raise row
+    if not isinstance(row, dict):
+        raise RowError('Row must be an object')
+
+    text = {field: get_text(row.get(field), field) for field in (*PRODUCT_FIELDS, 'sku', 'type')}
+    for field, value in text.items():
+        if not value:
+            raise RowError(f'{field} is required')
+
+    gender = text['gender']
+    if gender not in dict(Product.GENDER_CHOICES):
+        raise RowError(f"gender must be one of {', '.join(dict(Product.GENDER_CHOICES))}")
+
+    attributes = row.get('attributes') or []
+    if isinstance(attributes, str):
+        try:
+            attributes = json.loads(attributes)
+        except ValueError:
+            raise RowError('attributes must be a JSON list')
+    if not isinstance(attributes, list) or not all(
+        isinstance(attribute, dict) and attribute.get('name') and attribute.get('value') for attribute in attributes
+    ):
+        raise RowError('attributes must be a list of objects with name and value')
+    attributes = [
+        {
+            'name': get_text(attribute['name'], 'attributes'),
+            'description': get_text(attribute.get('description'), 'attributes'),
+            'value': get_text(attribute['value'], 'attributes'),
+        }
+        for attribute in attributes
+    ]
+
+    brands = get_names(row.get('brands'), 'brands')
+    categories = get_names(row.get('categories'), 'categories')
+    if not brands:
+        raise RowError('brands are required')
+    if not categories:
+        raise RowError('categories are required')
+
+    return {
+        'product': {
+            'name': text['name'],
+            'description': text['description'],
+            'gender': gender,
+        },
+        'type': text['type'],
+        'brands': brands,
+        'categories': categories,
+        'sub_product': {
+            'sku': text['sku'],
+            'retail_price': get_number(row, 'retail_price', Decimal),
+            'sale_price': get_number(row, 'sale_price', Decimal),
+            'store_price': get_number(row, 'store_price', Decimal),
+            'weight': get_number(row, 'weight', float),
+            'discount': get_number(row, 'discount', float, 0.0),
+        },
+        'units': get_number(row, 'units', int, 0),
+        'attributes': attributes,
+    }
+
+
+class CatalogImporter:
+    """
+    Imports products with their sub-products, stocks and attributes of a business card
+    from a stream of rows, by batches of `batch_size` rows in a transaction each.
+    Brands, categories and types are looked up by name in bulk and must exist.
+    Invalid rows are reported by their line and skipped.
+    """
+
+    def __init__(self, card, batch_size=None, max_errors=1000):
+        self.card = card
+        self.batch_size = batch_size or getattr(settings, 'PRODUCT_IMPORT_BATCH_SIZE', 1000)
+        self.max_errors = max_errors
+        self.rows = 0
+        self.products = 0
+        self.sub_products = 0
+        self.errors = []
+        self.error_count = 0
+        # Lines of the current batch with an error
+        self.error_lines = set()
+        self.lookups = {Brand: {}, Category: {}, Type: {}}
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        self.error_lines.add(line)
+        if len(self.errors) < self.max_errors:
+            self.errors.append((line, str(message)))
+
+    def lookup(self, model, names):
+        """Ids of the rows of the model by name, remembered over the batches"""
+        known = self.lookups[model]
+        missing = set(names) - set(known)
+        if missing:
+            found = dict(model.objects.filter(name__in=missing).values_list('name', 'id'))
+            for name in missing:
+                known[name] = found.get(name)
+        return known
+
+    def run(self, rows):
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                break
+            self.rows += len(batch)
+            self.import_batch(batch)
+        return self
+
+    def import_batch(self, batch):
+        self.error_lines = set()
+        parsed = []
+        for line, row in batch:
+            try:
+                parsed.append((line, parse_row(row)))
+            except RowError as error:
+                self.add_error(line, error)
+
+        try:
+            with transaction.atomic():
+                products, sub_products = self.save(self.resolve(parsed))
+        except Exception as error:
+            # Rows with unknown names or duplicate skus are already reported
+            for line, row in parsed:
+                if line not in self.error_lines:
+                    self.add_error(line, f'Batch failed: {error}')
+            return
+
+        self.products += products
+        self.sub_products += sub_products
+
+    def resolve(self, parsed):
+        """Rows with the ids of their brands, categories and type, reporting unknown names"""
+        brands = self.lookup(Brand, {name for line, row in parsed for name in row['brands']})
+        categories = self.lookup(Category, {name for line, row in parsed for name in row['categories']})
+        types = self.lookup(Type, {row['type'] for line, row in parsed})
+
+        resolved = []
+        for line, row in parsed:
+            unknown = [
+                f'{kind} {name}' for kind, names, ids in (
+                    ('brand', row['brands'], brands),
+                    ('category', row['categories'], categories),
+                    ('type', [row['type']], types),
+                ) for name in names if ids.get(name) is None
+            ]
+            if unknown:
+                self.add_error(line, f"Unknown {', '.join(unknown)}")
+                continue
+
+            row['brand_ids'] = [brands[name] for name in row['brands']]
+            row['category_ids'] = [categories[name] for name in row['categories']]
+            row['type_id'] = types[row['type']]
+            resolved.append((line, row))
+        return resolved
+
+    def save(self, resolved):
+        """Insert the rows of the batch, returns the numbers of the new products and sub-products"""
+        if not resolved:
+            return 0, 0
+
+        names = {row['product']['name'] for line, row in resolved}
+        product_ids = dict(Product.objects.filter(card=self.card, name__in=names).values_list('name', 'id'))
+
+        new_products = {}
+        for line, row in resolved:
+            name = row['product']['name']
+            if name not in product_ids and name not in new_products:
+                new_products[name] = row
+        # A product created meanwhile by a concurrent import is skipped by its unique name
+        Product.objects.bulk_create([
+            Product(card=self.card, type_id=row['type_id'], **row['product']) for row in new_products.values()
+        ], batch_size=self.batch_size, ignore_conflicts=True)
+        # Fetched back by name, bulk_create doesn't return ids on every database
+        product_ids.update(
+            Product.objects.filter(card=self.card, name__in=new_products).values_list('name', 'id')
+        )
+
+        Product.brand.through.objects.bulk_create([
+            Product.brand.through(product_id=product_ids[name], brand_id=brand_id)
+            for name, row in new_products.items() for brand_id in row['brand_ids']
+        ], batch_size=self.batch_size, ignore_conflicts=True)
+        Product.category.through.objects.bulk_create([
+            Product.category.through(product_id=product_ids[name], category_id=category_id)
+            for name, row in new_products.items() for category_id in row['category_ids']
+        ], batch_size=self.batch_size, ignore_conflicts=True)
+
+        existing = set(
+            SubProduct.objects.filter(product_id__in=product_ids.values(), sku__in={
+                row['sub_product']['sku'] for line, row in resolved
+            }).values_list('product_id', 'sku')
+        )
+        new_sub_products = {}
+        for line, row in resolved:
+            key = (product_ids[row['product']['name']], row['sub_product']['sku'])
+            if key in existing or key in new_sub_products:
+                self.add_error(line, f"Product {row['product']['name']} already has a sub-product {key[1]}")
+                continue
+            new_sub_products[key] = row
+
+        SubProduct.objects.bulk_create([
+            SubProduct(product_id=product_id, **row['sub_product'])
+            for (product_id, sku), row in new_sub_products.items()
+        ], batch_size=self.batch_size)
+        sub_product_ids = {
+            (product_id, sku): id for id, product_id, sku in SubProduct.objects.filter(
+                product_id__in={product_id for product_id, sku in new_sub_products},
+                sku__in={sku for product_id, sku in new_sub_products},
+            ).values_list('id', 'product_id', 'sku')
+        }
+
+        Stock.objects.bulk_create([
+            Stock(sub_product_id=sub_product_ids[key], units=row['units'])
+            for key, row in new_sub_products.items()
+        ], batch_size=self.batch_size)
+        Attribute.objects.bulk_create([
+            Attribute(sub_product_id=sub_product_ids[key], **attribute)
+            for key, row in new_sub_products.items() for attribute in row['attributes']
+        ], batch_size=self.batch_size, ignore_conflicts=True)
+
+        # bulk_create skips the signals, refresh the aggregates and outdate the caches once per batch
+        Product.objects.filter(id__in={product_id for product_id, sku in new_sub_products}).refresh_aggregates()
+        transaction.on_commit(lambda: invalidate_models(Product, SubProduct, Stock, Attribute))
+
+        return len(new_products), len(new_sub_products)
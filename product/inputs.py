@@ -46,6 +46,14 @@ class StockInput(graphene.InputObjectType):
     units_sold = graphene.Int()
 
 
+class StockItemInput(graphene.InputObjectType):
+    sku = graphene.String()
+    sub_product_id = graphene.ID()
+    last_checked = graphene.DateTime()
+    units = graphene.Int()
+    units_sold = graphene.Int()
+
+
 class AttributeInput(graphene.InputObjectType):
     name = graphene.String(required=True)
     description = graphene.String(required=True)
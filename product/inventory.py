@@ -0,0 +1,146 @@
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from backend.cache import invalidate_models
+from .models import Product, Stock, SubProduct
+from .shards import clear_shards
+
+STOCK_FIELDS = ('units', 'units_sold', 'last_checked')
+
+
+class StockError(Exception):
+    pass
+
+
+def parse_stock_row(row):
+    """Values of a stock update from a file row: sku or sub_product_id and the stock fields"""
+    if isinstance(row, Exception):
+        raise StockError(str(row))
+    if not isinstance(row, dict):
+        raise StockError('Row must be an object')
+
+    item = {'sku': row.get('sku') or None, 'sub_product_id': row.get('sub_product_id') or None}
+    for field in ('units', 'units_sold'):
+        if row.get(field) not in (None, ''):
+            try:
+                item[field] = int(row[field])
+            except (TypeError, ValueError):
+                raise StockError(f'{field} must be an integer')
+    if row.get('last_checked') not in (None, ''):
+        item['last_checked'] = parse_datetime(str(row['last_checked']))
+        if item['last_checked'] is None:
+            raise StockError('last_checked must be a date and time')
+        if settings.USE_TZ and timezone.is_naive(item['last_checked']):
+            item['last_checked'] = timezone.make_aware(item['last_checked'])
+    return item
+
+
+class StockUpdater:
+    """
+    Applies stock levels to the sub-products of a business card, found by sku or id.
+    Every batch is checked against the business card by one query and written
+    by bulk_update (CASE statements), all batches run in one transaction.
+    """
+
+    def __init__(self, card, batch_size=None, max_errors=1000):
+        self.card = card
+        self.batch_size = batch_size or getattr(settings, 'PRODUCT_IMPORT_BATCH_SIZE', 1000)
+        self.max_errors = max_errors
+        self.items = 0
+        self.updated = 0
+        self.created = 0
+        self.errors = []
+        self.error_count = 0
+        self.product_ids = set()
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append((line, str(message)))
+
+    def run(self, items):
+        """Apply the (line, item) pairs, items are dicts with sku or sub_product_id and the stock fields"""
+        items = iter(items)
+        with transaction.atomic():
+            while True:
+                batch = list(islice(items, self.batch_size))
+                if not batch:
+                    break
+                self.items += len(batch)
+                self.update_batch(batch)
+
+            if self.product_ids:
+                Product.objects.filter(id__in=self.product_ids).refresh_aggregates()
+                transaction.on_commit(lambda: invalidate_models(Stock, Product))
+        return self
+
+    def find_sub_products(self, batch):
+        """Sub-products of the business card referenced by the batch, by id and by sku"""
+        ids = {str(item['sub_product_id']) for line, item in batch if item.get('sub_product_id')}
+        skus = {item['sku'] for line, item in batch if item.get('sku') and not item.get('sub_product_id')}
+
+        rows = SubProduct.objects.filter(product__card=self.card).filter(
+            Q(id__in=[pk for pk in ids if pk.isdigit()]) | Q(sku__in=skus)
+        ).values('id', 'sku', 'product_id', 'stock__id')
+
+        by_id = {}
+        by_sku = defaultdict(list)
+        for row in rows:
+            by_id[str(row['id'])] = row
+            by_sku[row['sku']].append(row)
+        return by_id, by_sku
+
+    def update_batch(self, batch):
+        by_id, by_sku = self.find_sub_products(batch)
+
+        changes = {}
+        for line, item in batch:
+            if item.get('sub_product_id'):
+                row = by_id.get(str(item['sub_product_id']))
+                if row is None:
+                    self.add_error(line, f"Sub-product {item['sub_product_id']} of your business card doesn't exist")
+                    continue
+            elif item.get('sku'):
+                rows = by_sku.get(item['sku'], [])
+                if len(rows) != 1:
+                    self.add_error(line, (
+                        f"Sub-product {item['sku']} of your business card doesn't exist" if not rows else
+                        f"Sku {item['sku']} belongs to several products, use sub_product_id"
+                    ))
+                    continue
+                row = rows[0]
+            else:
+                self.add_error(line, 'sku or sub_product_id is required')
+                continue
+
+            fields = {field: item[field] for field in STOCK_FIELDS if item.get(field) is not None}
+            if not fields:
+                self.add_error(line, f"Nothing to update, set one of {', '.join(STOCK_FIELDS)}")
+                continue
+
+            # The last update of a sub-product in the batch wins
+            previous = changes.get(row['id'], (row, {}))[1]
+            changes[row['id']] = (row, {**previous, **fields})
+
+        stocks = defaultdict(list)
+        new_stocks = []
+        for sub_product_id, (row, fields) in changes.items():
+            self.product_ids.add(row['product_id'])
+            if row['stock__id'] is None:
+                new_stocks.append(Stock(sub_product_id=sub_product_id, **fields))
+            else:
+                stocks[tuple(sorted(fields))].append(Stock(id=row['stock__id'], **fields))
+
+        for fields, objects in stocks.items():
+            Stock.objects.bulk_update(objects, fields, batch_size=self.batch_size)
+            clear_shards([stock.id for stock in objects], fields)
+            self.updated += len(objects)
+
+        Stock.objects.bulk_create(new_stocks, batch_size=self.batch_size)
+        self.created += len(new_stocks)
@@ -0,0 +1,109 @@
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from graphene_django.settings import graphene_settings
+
+from product.models import Product
+
+LISTING_QUERY = '''
+    query($page: Int) {
+        products(page: $page) {
+            result {
+                id
+                name
+                description
+                gender
+                subProduct {
+                    id
+                    sku
+                    retailPrice
+                    salePrice
+                    attributes { id name description value }
+                }
+            }
+            page
+            hasNext
+            hasPrevious
+        }
+    }
+'''
+
+
+class PaginationCheckMiddleware(object):
+    """
+    Per-field check of the removed CustomPaginationMiddleware, the pagination itself is done
+    by PaginatedField, so every field is passed on and only the cost of the check remains
+    """
+
+    def resolve(self, next, root, info, **kwargs):
+        try:
+            is_paginated = info.return_type.name[-9:]
+            is_paginated = is_paginated == 'Paginated'
+        except Exception:
+            is_paginated = False
+
+        return next(root, info, **kwargs)
+
+
+class FieldCountMiddleware(object):
+    """Number of the resolved fields"""
+
+    def __init__(self):
+        self.count = 0
+
+    def resolve(self, next, root, info, **kwargs):
+        self.count += 1
+        return next(root, info, **kwargs)
+
+
+class Command(BaseCommand):
+    help = (
+        'Time a products listing with the pagination resolvers attached to their fields '
+        'and with the per-field pagination middleware they replaced, on the current catalog'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=20, help='Queries per measurement')
+        parser.add_argument('--repeat', type=int, default=5, help='Measurements, the best one is shown')
+        parser.add_argument('--page', type=int, default=1, help='Page of the listing')
+
+    def execute_query(self, options, middleware):
+        request = RequestFactory().post('/graphql')
+        request.user = AnonymousUser()
+        result = graphene_settings.SCHEMA.execute(
+            LISTING_QUERY, variables={'page': options['page']}, context_value=request, middleware=middleware
+        )
+        if result.errors:
+            raise CommandError(f'Listing failed: {result.errors[0]}')
+
+    def measure(self, options, middleware):
+        """Best time of a query in milliseconds"""
+        best = None
+        for _ in range(options['repeat']):
+            started = time.perf_counter()
+            for _ in range(options['runs']):
+                self.execute_query(options, middleware)
+            elapsed = (time.perf_counter() - started) * 1000 / options['runs']
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def handle(self, *args, **options):
+        if min(options['runs'], options['repeat'], options['page']) < 1:
+            raise CommandError('Runs, repeat and page must be positive!')
+        if not Product.objects.exists():
+            raise CommandError('The catalog has no products to list!')
+
+        counter = FieldCountMiddleware()
+        self.execute_query(options, [counter])
+        self.stdout.write(f'{counter.count} fields resolved per query')
+
+        # Warm up the caches of the schema and the database before measuring
+        self.execute_query(options, [])
+
+        before = self.measure(options, [PaginationCheckMiddleware()])
+        after = self.measure(options, [])
+        self.stdout.write(f'  before (pagination middleware): {before:.1f} ms/query')
+        self.stdout.write(f'  after  (PaginatedField):        {after:.1f} ms/query')
+        self.stdout.write(f'{(before - after) * 1000 / counter.count:.2f} us of middleware overhead per field')
@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from backend.cache import invalidate_models
+from product.models import Product, Stock
+from product.shards import compact_stock
+
+
+class Command(BaseCommand):
+    help = (
+        'Fold the counter shards of stocks into their rows, spread the units over '
+        'shard_count shards again and refresh the units in stock of their products'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=100, help='Stocks per transaction')
+        parser.add_argument(
+            '--interval', type=int, help='Keep compacting every INTERVAL seconds instead of compacting once'
+        )
+
+    def compact(self, chunk_size):
+        # Stocks set back to shard_count=0 still have shards to fold
+        stocks = Stock.objects.filter(Q(shard_count__gt=0) | Q(shards__isnull=False)).distinct()
+        total = 0
+        last_id = 0
+        while True:
+            ids = list(stocks.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size])
+            if not ids:
+                return total
+
+            # A transaction per stock, the locks of hot stocks are held as briefly as possible
+            for stock_id in ids:
+                compact_stock(stock_id)
+            Product.objects.filter(sub_product__stock__id__in=ids).refresh_aggregates()
+            invalidate_models(Stock, Product)
+            total += len(ids)
+            last_id = ids[-1]
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('Chunk size must be positive!')
+
+        while True:
+            total = self.compact(options['chunk_size'])
+            self.stdout.write(self.style.SUCCESS(f'Shards of {total} stocks compacted'))
+
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from product.reservations import expire_reservations
+
+
+class Command(BaseCommand):
+    help = 'Give the units of expired stock reservations back to the stock'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Reservations per transaction')
+        parser.add_argument(
+            '--interval', type=int, help='Keep sweeping every INTERVAL seconds instead of sweeping once'
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('Chunk size must be positive!')
+
+        while True:
+            expired = expire_reservations(options['chunk_size'])
+            self.stdout.write(self.style.SUCCESS(f'{expired} reservations expired'))
+
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
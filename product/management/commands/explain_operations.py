@@ -0,0 +1,180 @@
+import json
+import re
+from pathlib import Path
+
+from django.apps import apps
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+from graphene_django.settings import graphene_settings
+
+from backend.documents import document_backend
+
+OPERATIONS = Path(__file__).resolve().parents[2] / 'operations' / 'catalog.json'
+
+# Plan lines of a table read from the first to the last row or of a sort without an index
+PROBLEMS = {
+    'sqlite': [
+        ('full scan', re.compile(r'\bSCAN (?!.*(\bUSING\b.*\bINDEX\b|\bVIRTUAL TABLE\b))')),
+        ('temp b-tree', re.compile(r'\bUSE TEMP B-TREE\b')),
+    ],
+    'postgresql': [
+        ('full scan', re.compile(r'\bSeq Scan\b')),
+        ('sort', re.compile(r'^\s*(->\s*)?Sort\b')),
+    ],
+}
+
+# Plan lines of a table read without an index, in the order of its rows. Under a LIMIT
+# without a sort they stop after the page, like a walk of the primary key
+ORDERED_SCANS = {
+    'sqlite': re.compile(r'^SCAN (\w+)$'),
+    'postgresql': re.compile(r'\bSeq Scan on (\w+)'),
+}
+
+
+def get_main_table(sql):
+    """Table of the FROM clause of the outer query"""
+    depth = 0
+    for match in re.finditer(r'[()]|\bFROM "(\w+)"', sql):
+        if match.group() == '(':
+            depth += 1
+        elif match.group() == ')':
+            depth -= 1
+        elif depth == 0:
+            return match.group(1)
+    return None
+
+
+def is_ordered_scan(line, table):
+    match = ORDERED_SCANS[connection.vendor].search(line)
+    return match is not None and match.group(1) == table
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay the recorded GraphQL operations, EXPLAIN the SQL they run '
+        'and flag full table scans and sorts without an index'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'operations', nargs='?', default=str(OPERATIONS),
+            help=(
+                'JSON list of {"name", "query", "variables"} operations, "row_variables" maps variables '
+                'to the models whose first row id they take and "allow" maps small tables to the problems '
+                'allowed in the statements reading from them'
+            )
+        )
+        parser.add_argument(
+            '--fail', action='store_true', help='Exit with an error when any statement is flagged'
+        )
+
+    def load_operations(self, path):
+        try:
+            with open(path) as file:
+                return json.load(file)
+        except (OSError, ValueError) as error:
+            raise CommandError(f'Cannot read operations from {path}: {error}')
+
+    def get_variables(self, operation):
+        """Variables of the operation, "row_variables" take the id of the first row of their model"""
+        variables = dict(operation.get('variables') or {})
+        for name, label in (operation.get('row_variables') or {}).items():
+            try:
+                model = apps.get_model(label)
+            except (LookupError, ValueError):
+                raise CommandError(f"Model {label} of the variable {name} doesn't exist!")
+            pk = model._default_manager.order_by('pk').values_list('pk', flat=True).first()
+            if pk is None:
+                raise CommandError(f'The variable {name} needs a row of {label}, seed the database first!')
+            variables[name] = pk
+        return variables
+
+    def capture(self, operation):
+        """Execute the operation in a rolled back transaction and return the statements it ran"""
+        statements = []
+
+        def wrapper(execute, sql, params, many, context):
+            if not many and sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+                statements.append((sql, params))
+            return execute(sql, params, many, context)
+
+        request = RequestFactory().post('/graphql')
+        request.user = AnonymousUser()
+        variables = self.get_variables(operation)
+
+        with transaction.atomic():
+            with connection.execute_wrapper(wrapper):
+                result = graphene_settings.SCHEMA.execute(
+                    operation['query'],
+                    variables=variables,
+                    operation_name=operation.get('operationName'),
+                    context_value=request,
+                    backend=document_backend,
+                )
+            transaction.set_rollback(True)
+
+        for error in result.errors or []:
+            self.stderr.write(f'  error: {error}')
+
+        unique = {}
+        for sql, params in statements:
+            unique.setdefault(sql, params)
+        return list(unique.items())
+
+    def explain(self, sql, params):
+        """Lines of the query plan of the statement"""
+        prefix = 'EXPLAIN QUERY PLAN' if connection.vendor == 'sqlite' else 'EXPLAIN'
+        with connection.cursor() as cursor:
+            cursor.execute(f'{prefix} {sql}', params)
+            rows = cursor.fetchall()
+
+        if connection.vendor == 'sqlite':
+            return [row[-1] for row in rows]
+        return [row[0] for row in rows]
+
+    def find_problems(self, sql, plan, problems):
+        """Names of the problems of the plan, a scan of the main table in row order under a LIMIT isn't one"""
+        found = {name: [line for line in plan if pattern.search(line)] for name, pattern in problems}
+
+        sorts = [lines for name, lines in found.items() if name != 'full scan']
+        if not any(sorts) and re.search(r'\bLIMIT \d+$', sql.rstrip()):
+            main_table = get_main_table(sql)
+            found['full scan'] = [line for line in found['full scan'] if not is_ordered_scan(line, main_table)]
+
+        return sorted(name for name, lines in found.items() if lines)
+
+    def handle(self, *args, **options):
+        problems = PROBLEMS.get(connection.vendor)
+        if problems is None:
+            raise CommandError(f"Query plans of {connection.vendor} aren't supported!")
+
+        total = 0
+        flagged = 0
+
+        for index, operation in enumerate(self.load_operations(options['operations']), 1):
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{operation.get('name') or f'Operation {index}'}"))
+
+            allowed = operation.get('allow') or {}
+            for sql, params in self.capture(operation):
+                total += 1
+                plan = self.explain(sql, params)
+                found = self.find_problems(sql, plan, problems)
+
+                summary = sql if len(sql) <= 160 else f'{sql[:157]}...'
+                allowed_here = allowed.get(get_main_table(sql), ())
+                if found and all(name in allowed_here for name in found):
+                    self.stdout.write(f"  [allowed: {', '.join(found)}] {summary}")
+                elif found:
+                    flagged += 1
+                    self.stdout.write(self.style.WARNING(f"  [{', '.join(found)}] {summary}"))
+                else:
+                    self.stdout.write(f'  [ok] {summary}')
+                for line in plan:
+                    self.stdout.write(f'      {line}')
+
+        message = f'{flagged} of {total} statements use a full scan or a sort without an index'
+        if flagged and options['fail']:
+            raise CommandError(message)
+        self.stdout.write(self.style.WARNING(message) if flagged else self.style.SUCCESS(message))
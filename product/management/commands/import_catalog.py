@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from product.importer import CatalogImporter, get_format, read_rows
+from product.models import BusinessCard
+
+
+class Command(BaseCommand):
+    help = 'Import products, sub-products, stocks and attributes of a business card from a CSV or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSONL file, one row per sub-product')
+        parser.add_argument('--card', required=True, help='Name of the business card owning the products')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Format of the file, by its extension')
+        parser.add_argument('--batch-size', type=int, help='Rows per transaction and bulk insert')
+
+    def handle(self, *args, **options):
+        try:
+            card = BusinessCard.objects.get(name=options['card'])
+        except BusinessCard.DoesNotExist:
+            raise CommandError(f"Business card {options['card']} doesn't exist!")
+
+        if options['batch_size'] is not None and options['batch_size'] < 1:
+            raise CommandError('Batch size must be positive!')
+
+        path = options['path']
+        try:
+            with open(path, newline='', encoding='utf-8') as file:
+                importer = CatalogImporter(card, batch_size=options['batch_size']).run(
+                    read_rows(file, options['format'] or get_format(path))
+                )
+        except OSError as error:
+            raise CommandError(f'Cannot read {path}: {error}')
+
+        for line, message in importer.errors:
+            self.stderr.write(f'Line {line}: {message}')
+        if importer.error_count > len(importer.errors):
+            self.stderr.write(f'... and {importer.error_count - len(importer.errors)} more errors')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{importer.rows} rows read: {importer.products} products and '
+            f'{importer.sub_products} sub-products imported, {importer.error_count} errors'
+        ))
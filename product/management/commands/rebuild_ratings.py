@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from backend.cache import invalidate_models
+from product.models import Product, SubProduct
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the rating sums, counts, histograms and scores of sub-products '
+        'from their comments in chunks, repairing any drift'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Sub-products per UPDATE')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        if chunk_size < 1:
+            raise CommandError('Chunk size must be positive!')
+
+        total = 0
+        last_id = 0
+        while True:
+            ids = list(
+                SubProduct.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size]
+            )
+            if not ids:
+                break
+
+            with transaction.atomic():
+                total += SubProduct.objects.filter(id__gte=ids[0], id__lte=ids[-1]).refresh_ratings()
+                Product.objects.filter(sub_product__id__in=ids).refresh_aggregates()
+            last_id = ids[-1]
+
+        if total:
+            # Queryset updates send no signals, cached counts and responses are outdated here
+            invalidate_models(Product, SubProduct)
+        self.stdout.write(self.style.SUCCESS(f'Ratings of {total} sub-products rebuilt'))
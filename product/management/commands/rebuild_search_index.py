@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from product.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Create the product search index if needed and fill it with the existing products'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        backend.install()
+        backend.rebuild()
+
+        self.stdout.write(self.style.SUCCESS(f'Search index rebuilt by {type(backend).__name__}'))
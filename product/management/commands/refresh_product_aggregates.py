@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from backend.cache import invalidate_models
+from product.models import Product, SubProduct, get_product_aggregates
+
+
+class Command(BaseCommand):
+    help = 'Backfill the price, rating and stock aggregate columns of products in chunks or verify them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Products per UPDATE')
+        parser.add_argument(
+            '--verify', action='store_true', help='Only report products with outdated aggregates'
+        )
+
+    def get_chunks(self, chunk_size):
+        """Ranges of product ids with up to chunk_size products each"""
+        last_id = 0
+        while True:
+            ids = list(
+                Product.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size]
+            )
+            if not ids:
+                return
+            yield ids[0], ids[-1]
+            last_id = ids[-1]
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('Chunk size must be positive!')
+
+        aggregates = get_product_aggregates()
+        fields = list(aggregates)
+        total = 0
+        outdated = 0
+
+        for first_id, last_id in self.get_chunks(options['chunk_size']):
+            products = Product.objects.filter(id__gte=first_id, id__lte=last_id)
+
+            if options['verify']:
+                rows = products.annotate(**{f'actual_{field}': aggregates[field] for field in fields})
+                for product in rows.values('id', *fields, *(f'actual_{field}' for field in fields)):
+                    total += 1
+                    wrong = [field for field in fields if product[field] != product[f'actual_{field}']]
+                    if wrong:
+                        outdated += 1
+                        self.stdout.write(f"Product {product['id']}: outdated {', '.join(wrong)}")
+            else:
+                with transaction.atomic():
+                    total += products.refresh_aggregates()
+
+        if options['verify']:
+            if outdated:
+                raise CommandError(f'{outdated} of {total} products have outdated aggregates!')
+            self.stdout.write(self.style.SUCCESS(f'Aggregates of {total} products are up to date'))
+        else:
+            if total:
+                # Queryset updates send no signals, cached counts and responses are outdated here
+                invalidate_models(Product, SubProduct)
+            self.stdout.write(self.style.SUCCESS(f'Aggregates of {total} products refreshed'))
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from product.importer import get_format, read_rows
+from product.inventory import StockError, StockUpdater, parse_stock_row
+from product.models import BusinessCard
+
+
+class Command(BaseCommand):
+    help = (
+        'Apply stock levels of a business card from a CSV or JSONL file with the '
+        'sku or sub_product_id, units, units_sold and last_checked columns'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSONL file, one row per sub-product')
+        parser.add_argument('--card', required=True, help='Name of the business card owning the sub-products')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Format of the file, by its extension')
+        parser.add_argument('--batch-size', type=int, help='Rows per ownership check and bulk update')
+
+    def handle(self, *args, **options):
+        try:
+            card = BusinessCard.objects.get(name=options['card'])
+        except BusinessCard.DoesNotExist:
+            raise CommandError(f"Business card {options['card']} doesn't exist!")
+
+        if options['batch_size'] is not None and options['batch_size'] < 1:
+            raise CommandError('Batch size must be positive!')
+
+        updater = StockUpdater(card, batch_size=options['batch_size'])
+
+        def get_items(rows):
+            for line, row in rows:
+                try:
+                    yield line, parse_stock_row(row)
+                except StockError as error:
+                    updater.add_error(line, error)
+
+        path = options['path']
+        try:
+            with open(path, newline='', encoding='utf-8') as file:
+                updater.run(get_items(read_rows(file, options['format'] or get_format(path))))
+        except OSError as error:
+            raise CommandError(f'Cannot read {path}: {error}')
+
+        for line, message in updater.errors:
+            self.stderr.write(f'Line {line}: {message}')
+        if updater.error_count > len(updater.errors):
+            self.stderr.write(f'... and {updater.error_count - len(updater.errors)} more errors')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{updater.updated} stocks updated and {updater.created} created, {updater.error_count} errors'
+        ))
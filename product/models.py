@@ -1,6 +1,11 @@
+from collections import Counter, defaultdict
+
+from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.core.validators import RegexValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, FloatField, Max, Min, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
 from django.utils.translation import gettext_lazy as _
 
 from user.models import User
@@ -163,6 +168,40 @@ class Type(models.Model):
         return self.name
 
 
+def get_product_aggregates():
+    """Expressions computing the aggregate columns of a product from its active sub-products"""
+    sub_products = SubProduct.objects.filter(product=OuterRef('pk'), is_active=True).order_by().values('product')
+
+    # Units of sharded stocks are spread over their stock row and its shards
+    shards = StockShard.objects.filter(
+        stock__sub_product__product=OuterRef('pk'), stock__sub_product__is_active=True
+    ).order_by().values('stock__sub_product__product')
+
+    def aggregate(name, expression, rows=sub_products):
+        field = Product._meta.get_field(name)
+        return Coalesce(
+            Subquery(rows.annotate(value=expression).values('value')), Value(0), output_field=field
+        )
+
+    return {
+        'min_price': aggregate('min_price', Min('sale_price')),
+        'max_price': aggregate('max_price', Max('sale_price')),
+        'max_rating': aggregate('max_rating', Max('avg_rating')),
+        'max_rating_score': aggregate('max_rating_score', Max('rating_score')),
+        'units_in_stock': (
+            aggregate('units_in_stock', Sum('stock__units')) + aggregate('units_in_stock', Sum('units'), shards)
+        ),
+        'active_sub_products': aggregate('active_sub_products', Count('pk')),
+    }
+
+
+class ProductQuerySet(models.QuerySet):
+
+    def refresh_aggregates(self):
+        """Recompute the aggregate columns of the products in one UPDATE"""
+        return self.update(**get_product_aggregates())
+
+
 class Product(models.Model):
     """
     Product detail table
@@ -181,6 +220,7 @@ class Product(models.Model):
     )
     name = models.CharField(
         max_length=256,
+        db_index=True,
         verbose_name=_('product name'),
         help_text=_('format: required, max-256')
     )
@@ -207,6 +247,7 @@ class Product(models.Model):
     created_at = models.DateTimeField(
         auto_now_add=True,
         editable=False,
+        db_index=True,
         verbose_name=_('date product created'),
         help_text=_('format: Y-m-d H:M:S'),
     )
@@ -215,15 +256,119 @@ class Product(models.Model):
         verbose_name=_('date product last updated'),
         help_text=_('format: Y-m-d H:M:S')
     )
+    # Aggregates of the active sub-products, kept up to date by ProductQuerySet.refresh_aggregates
+    min_price = models.DecimalField(
+        max_digits=9,
+        decimal_places=2,
+        default=0,
+        db_index=True,
+        editable=False,
+        verbose_name=_('minimal sale price of sub-products')
+    )
+    max_price = models.DecimalField(
+        max_digits=9,
+        decimal_places=2,
+        default=0,
+        db_index=True,
+        editable=False,
+        verbose_name=_('maximal sale price of sub-products')
+    )
+    max_rating = models.FloatField(
+        default=0,
+        db_index=True,
+        editable=False,
+        verbose_name=_('best average rating of sub-products')
+    )
+    max_rating_score = models.FloatField(
+        default=0,
+        db_index=True,
+        editable=False,
+        verbose_name=_('best bayesian rating score of sub-products')
+    )
+    units_in_stock = models.IntegerField(
+        default=0,
+        db_index=True,
+        editable=False,
+        verbose_name=_('units/qty of sub-products in stock')
+    )
+    active_sub_products = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name=_('number of active sub-products')
+    )
+
+    objects = ProductQuerySet.as_manager()
 
     class Meta:
         verbose_name = _('Product')
         verbose_name_plural = _('Products')
+        constraints = [
+            # Its index also serves products(mine: true) of the business card, sorted by name
+            models.UniqueConstraint(fields=['card', 'name'], name='unique_product_name_per_card'),
+        ]
+        indexes = [
+            models.Index(fields=['is_active', '-created_at']),
+        ]
 
     def __str__(self):
         return self.name
 
 
+RATINGS = range(1, 6)
+
+
+def get_rating_columns(rating_sum, number_of_comment):
+    """
+    Expressions of the average rating and of the Bayesian score, the average pulled towards
+    PRODUCT_RATING_PRIOR_MEAN as if every sub-product had PRODUCT_RATING_PRIOR_COUNT more comments.
+    Without comments both are 0, the defaults of a new sub-product
+    """
+    prior_count = getattr(settings, 'PRODUCT_RATING_PRIOR_COUNT', 10)
+    prior_mean = getattr(settings, 'PRODUCT_RATING_PRIOR_MEAN', 3.0)
+    rating_sum = Cast(rating_sum, FloatField())
+
+    return {
+        'avg_rating': Coalesce(rating_sum / NullIf(number_of_comment, Value(0)), Value(0.0)),
+        'rating_score': Coalesce(
+            (rating_sum + Value(prior_count * prior_mean)) / (NullIf(number_of_comment, Value(0)) + Value(prior_count)),
+            Value(0.0)
+        ),
+    }
+
+
+class SubProductQuerySet(models.QuerySet):
+
+    def add_ratings(self, ratings):
+        """
+        Add the number of comments by rating (negative to remove them) by one atomic UPDATE,
+        which doesn't depend on the number of comments
+        """
+        rating_sum = F('rating_sum') + sum(rating * count for rating, count in ratings.items())
+        number_of_comment = F('number_of_comment') + sum(ratings.values())
+        return self.update(
+            rating_sum=rating_sum,
+            number_of_comment=number_of_comment,
+            **{f'rating_{rating}': F(f'rating_{rating}') + count for rating, count in ratings.items() if count},
+            **get_rating_columns(rating_sum, number_of_comment),
+        )
+
+    def refresh_ratings(self):
+        """Recompute the rating columns of the sub-products from their active comments in one UPDATE"""
+        comments = Comment.objects.filter(sub_product=OuterRef('pk'), is_active=True).order_by().values('sub_product')
+
+        def aggregate(expression):
+            return Coalesce(Subquery(comments.annotate(value=expression).values('value')), Value(0))
+
+        rating_sum = aggregate(Sum('rating'))
+        number_of_comment = aggregate(Count('pk'))
+        return self.update(
+            rating_sum=rating_sum,
+            number_of_comment=number_of_comment,
+            **{f'rating_{rating}': aggregate(Count('pk', filter=Q(rating=rating))) for rating in RATINGS},
+            **get_rating_columns(rating_sum, number_of_comment),
+        )
+
+
 class SubProduct(models.Model):
     """
     Sub product table
@@ -247,6 +392,22 @@ class SubProduct(models.Model):
         default=0,
         verbose_name=_('number of comment')
     )
+    rating_sum = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name=_('sum of ratings of active comments')
+    )
+    # Number of active comments with each rating, maintained with rating_sum
+    rating_1 = models.PositiveIntegerField(default=0, editable=False, verbose_name=_('comments rated 1'))
+    rating_2 = models.PositiveIntegerField(default=0, editable=False, verbose_name=_('comments rated 2'))
+    rating_3 = models.PositiveIntegerField(default=0, editable=False, verbose_name=_('comments rated 3'))
+    rating_4 = models.PositiveIntegerField(default=0, editable=False, verbose_name=_('comments rated 4'))
+    rating_5 = models.PositiveIntegerField(default=0, editable=False, verbose_name=_('comments rated 5'))
+    rating_score = models.FloatField(
+        default=0,
+        editable=False,
+        verbose_name=_('bayesian rating score')
+    )
     retail_price = models.DecimalField(
         max_digits=9,
         decimal_places=2,
@@ -306,9 +467,19 @@ class SubProduct(models.Model):
         help_text=_('format: Y-m-d H:M:S')
     )
 
+    objects = SubProductQuerySet.as_manager()
+
     class Meta:
         verbose_name = _('Sub product')
         verbose_name_plural = _('Sub products')
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'sku'], name='unique_sub_product_sku_per_product'),
+        ]
+        indexes = [
+            # Price and rating aggregates of the product over its active sub-products
+            models.Index(fields=['product', 'is_active', 'sale_price']),
+            models.Index(fields=['product', 'is_active', 'avg_rating']),
+        ]
 
     def __str__(self):
         return f'{self.product.name}  |  {self.sku}'
@@ -369,6 +540,12 @@ class Stock(models.Model):
         verbose_name=_('units sold to date'),
         help_text=_('format: required, default-0')
     )
+    shard_count = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name=_('counter shards'),
+        help_text=_('format: default-0, spread the units of a hot stock over shards, '
+                    'applied by compact_stock_shards')
+    )
 
     class Meta:
         verbose_name = _('stock')
@@ -378,6 +555,98 @@ class Stock(models.Model):
         return f'{self.sub_product.sku}  |  {self.units}'
 
 
+class StockShard(models.Model):
+    """
+    A part of the units and units sold of a hot stock. Writers update a random shard
+    instead of the single stock row, reads add the shards to the stock row
+    """
+
+    stock = models.ForeignKey(
+        Stock,
+        on_delete=models.CASCADE,
+        related_name='shards'
+    )
+    shard = models.PositiveSmallIntegerField(
+        verbose_name=_('shard number')
+    )
+    units = models.IntegerField(
+        default=0,
+        verbose_name=_('units/qty of the shard')
+    )
+    units_sold = models.IntegerField(
+        default=0,
+        verbose_name=_('units sold by the shard')
+    )
+
+    class Meta:
+        verbose_name = _('stock shard')
+        verbose_name_plural = _('stock shards')
+        unique_together = ('stock', 'shard')
+
+    def __str__(self):
+        return f'{self.stock_id}  |  {self.shard}  |  {self.units}'
+
+
+class StockReservation(models.Model):
+    """
+    Units of a sub-product taken from the stock for a user until they are
+    committed as sold, released or expired
+    """
+
+    HELD = 'H'
+    COMMITTED = 'C'
+    RELEASED = 'R'
+    EXPIRED = 'E'
+    STATUS_CHOICES = (
+        (HELD, _('Held')),
+        (COMMITTED, _('Committed')),
+        (RELEASED, _('Released')),
+        (EXPIRED, _('Expired')),
+    )
+
+    sub_product = models.ForeignKey(
+        SubProduct,
+        on_delete=models.CASCADE,
+        related_name='reservations'
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='stock_reservations'
+    )
+    quantity = models.PositiveIntegerField(
+        verbose_name=_('reserved units'),
+        help_text=_('format: required, min-1')
+    )
+    status = models.CharField(
+        max_length=1,
+        choices=STATUS_CHOICES,
+        default=HELD,
+        verbose_name=_('reservation status')
+    )
+    expires_at = models.DateTimeField(
+        verbose_name=_('date reservation expires'),
+        help_text=_('format: Y-m-d H:M:S'),
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        editable=False,
+        verbose_name=_('date reservation created'),
+        help_text=_('format: Y-m-d H:M:S'),
+    )
+
+    class Meta:
+        verbose_name = _('stock reservation')
+        verbose_name_plural = _('stock reservations')
+        indexes = [
+            # Held reservations past their expiry for the sweeper
+            models.Index(fields=['status', 'expires_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.sub_product_id}  |  {self.quantity}  |  {self.get_status_display()}'
+
+
 class Attribute(models.Model):
     """
     Product attribute table
@@ -445,44 +714,49 @@ class Comment(models.Model):
         verbose_name = _('Sub product comment')
         verbose_name_plural = _('Sub product comments')
         unique_together = ('user', 'sub_product')
-
-    def save(self, *args, **kwargs):
-        super(Comment, self).save(*args, **kwargs)
-
-        number_of_comment = 0
-        sum_of_rating = 0
-        sub_product = self.sub_product
-
-        comments = Comment.objects.filter(sub_product=sub_product, is_active=True)
-        for comment in comments:
-            number_of_comment += 1
-            sum_of_rating += comment.rating
-        avg_rating = float(sum_of_rating / number_of_comment)
-
-        SubProduct.objects.filter(id=sub_product.id).update(
-            number_of_comment=number_of_comment, avg_rating=avg_rating
-        )
+        indexes = [
+            # Rating of the sub-product over its active comments
+            models.Index(fields=['sub_product', 'is_active']),
+        ]
+
+    def get_ratings(self):
+        """Comments by rating this comment brings to its sub-product"""
+        return Counter({self.rating: 1} if self.is_active else {})
+
+    def update_ratings(self, changes):
+        """Apply the changes of the ratings by sub-product and refresh their products"""
+        changed = [sub_product_id for sub_product_id, ratings in changes.items() if any(ratings.values())]
+        for sub_product_id in changed:
+            SubProduct.objects.filter(id=sub_product_id).add_ratings(changes[sub_product_id])
+        if changed:
+            Product.objects.filter(sub_product__id__in=changed).refresh_aggregates()
+
+    def save(self, *args, previous=None, **kwargs):
+        """`previous` is the stored version of the comment when the caller already locked it"""
+        if self.rating not in RATINGS:
+            raise Exception(_('Rating must be from 1 to 5!'))
+
+        with transaction.atomic(savepoint=False):
+            changes = defaultdict(Counter)
+            if self.pk:
+                # Take back what the stored version of the comment added, locking it against concurrent edits
+                if previous is None:
+                    previous = Comment.objects.select_for_update().filter(pk=self.pk).first()
+                if previous is not None:
+                    changes[previous.sub_product_id].subtract(previous.get_ratings())
+
+            super(Comment, self).save(*args, **kwargs)
+
+            changes[self.sub_product_id].update(self.get_ratings())
+            self.update_ratings(changes)
 
     def delete(self, *args, **kwargs):
-
-        number_of_comment = 0
-        sum_of_rating = 0
-        sub_product = self.sub_product
-
-        super(Comment, self).delete(*args, **kwargs)
-
-        comments = Comment.objects.filter(sub_product=sub_product, is_active=True)
-
-        for comment in comments:
-            number_of_comment += 1
-            sum_of_rating += comment.rating
-
-        if sum_of_rating != 0:
-            avg_rating = float(sum_of_rating / number_of_comment)
-        else:
-            avg_rating = 0
-
-        sub = SubProduct.objects.get(id=sub_product.id)
-        sub.number_of_comment = number_of_comment
-        sub.avg_rating = avg_rating
-        sub.save()
+        with transaction.atomic():
+            previous = Comment.objects.select_for_update().filter(pk=self.pk).first()
+            result = super(Comment, self).delete(*args, **kwargs)
+
+            if previous is not None:
+                changes = defaultdict(Counter)
+                changes[previous.sub_product_id].subtract(previous.get_ratings())
+                self.update_ratings(changes)
+        return result
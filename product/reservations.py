@@ -0,0 +1,151 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from backend.cache import invalidate_models
+from .models import Product, Stock, StockReservation, SubProduct
+from .shards import move_shard_units
+
+
+def move_units(sub_product_id, units, units_sold=0, deltas=None):
+    """
+    Add units (negative to take them) to the stock of the sub-product by one conditional UPDATE,
+    which never lets the stock go below zero and holds the row lock only for the statement.
+    Sharded stocks update one of their shards instead. With a Counter as `deltas` the change
+    of the units in stock of the product is collected for move_units_in_stock()
+    """
+    stocks = Stock.objects.filter(sub_product_id=sub_product_id)
+    if units < 0:
+        stocks = stocks.filter(sub_product__is_active=True)
+
+    changes = {'units': F('units') + units}
+    if units_sold:
+        changes['units_sold'] = F('units_sold') + units_sold
+    stock = stocks.filter(shard_count=0)
+    if units < 0:
+        stock = stock.filter(units__gte=-units)
+
+    if stock.update(**changes):
+        if deltas is not None:
+            deltas[sub_product_id] += units
+        elif units:
+            # Only active sub-products count in the stock of the product
+            Product.objects.filter(sub_product__id=sub_product_id, sub_product__is_active=True).update(
+                units_in_stock=F('units_in_stock') + units
+            )
+    else:
+        # The product row would serialise the writers of a sharded stock again,
+        # its units in stock are refreshed by the compaction
+        sharded = stocks.filter(shard_count__gt=0).values_list('id', 'shard_count').first()
+        if sharded is None or not move_shard_units(*sharded, units, units_sold):
+            return False
+
+    # Only the responses selecting stocks are outdated, cached listings keep the units in
+    # stock of the products until their timeout instead of being flushed on every sale
+    transaction.on_commit(lambda: invalidate_models(Stock))
+    return True
+
+
+def move_units_in_stock(deltas):
+    """
+    Apply the changes of the units in stock collected by move_units() for many sub-products,
+    locking the products in the order of their ids
+    """
+    products = Counter()
+    rows = SubProduct.objects.filter(id__in=deltas, is_active=True).values_list('product_id', 'id')
+    for product_id, sub_product_id in rows:
+        products[product_id] += deltas[sub_product_id]
+
+    for product_id in sorted(products):
+        if products[product_id]:
+            Product.objects.filter(id=product_id).update(units_in_stock=F('units_in_stock') + products[product_id])
+
+
+def reserve_stock(user, sub_product_id, quantity):
+    """Take the units from the stock and hold them for the user for STOCK_RESERVATION_TIMEOUT seconds"""
+    if quantity < 1:
+        raise Exception("Quantity must be positive!")
+
+    timeout = getattr(settings, 'STOCK_RESERVATION_TIMEOUT', 15 * 60)
+    with transaction.atomic():
+        if not move_units(sub_product_id, -quantity):
+            if not SubProduct.objects.filter(id=sub_product_id, is_active=True).exists():
+                raise Exception("Sub-product doesn't exist!")
+            raise Exception("Not enough units in stock!")
+
+        return StockReservation.objects.create(
+            sub_product_id=sub_product_id,
+            user=user,
+            quantity=quantity,
+            expires_at=timezone.now() + timedelta(seconds=timeout),
+        )
+
+
+def finish_reservation(user, reservation_id, status):
+    """Move the held reservation of the user to the status, returns the reservation"""
+    with transaction.atomic():
+        reservation = StockReservation.objects.filter(id=reservation_id, user=user).first()
+        if reservation is None:
+            raise Exception("Reservation doesn't exist!")
+
+        held = StockReservation.objects.filter(id=reservation_id, status=StockReservation.HELD)
+        if status == StockReservation.COMMITTED:
+            held = held.filter(expires_at__gt=timezone.now())
+
+        # Only one of commit/release/expiry wins the conditional UPDATE of the status
+        if not held.update(status=status):
+            reservation.refresh_from_db()
+            if reservation.status == StockReservation.HELD:
+                raise Exception("Reservation has expired!")
+            raise Exception(f"Reservation is already {reservation.get_status_display().lower()}!")
+
+        if status == StockReservation.COMMITTED:
+            move_units(reservation.sub_product_id, 0, units_sold=reservation.quantity)
+        else:
+            move_units(reservation.sub_product_id, reservation.quantity)
+
+        reservation.status = status
+        return reservation
+
+
+def commit_reservation(user, reservation_id):
+    """Count the held units as sold"""
+    return finish_reservation(user, reservation_id, StockReservation.COMMITTED)
+
+
+def release_reservation(user, reservation_id):
+    """Give the held units back to the stock"""
+    return finish_reservation(user, reservation_id, StockReservation.RELEASED)
+
+
+def expire_reservations(chunk_size=1000):
+    """Give the units of the held reservations past their expiry back to the stock, returns their number"""
+    expired = 0
+    while True:
+        with transaction.atomic():
+            reservations = list(
+                StockReservation.objects.filter(
+                    status=StockReservation.HELD, expires_at__lte=timezone.now()
+                ).values_list('id', 'sub_product_id', 'quantity')[:chunk_size]
+            )
+            if not reservations:
+                return expired
+
+            units = Counter()
+            for id, sub_product_id, quantity in reservations:
+                # A reservation committed or released meanwhile keeps its units
+                if StockReservation.objects.filter(id=id, status=StockReservation.HELD).update(
+                    status=StockReservation.EXPIRED
+                ):
+                    units[sub_product_id] += quantity
+                    expired += 1
+
+            # Stocks and products are locked in the order of their ids, like by the checkouts
+            deltas = Counter()
+            for sub_product_id in sorted(units):
+                move_units(sub_product_id, units[sub_product_id], deltas=deltas)
+            move_units_in_stock(deltas)
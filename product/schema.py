@@ -1,25 +1,39 @@
+import io
+from copy import copy
+
 import graphene
+from django.db import transaction
 from django.db.models import Q
 from django.utils.translation import gettext_lazy as _
 from graphene_file_upload.scalars import Upload
 
+from backend.cache import invalidate_models
+from backend.mutations import UpdateMutation, unique_violation
+from backend.optimizer import optimize_queryset
 from backend.permissions import (
-    get_query, is_authenticated, paginate
+    PaginatedField, is_authenticated, resolve_queryset
 )
+from .filters import ProductFilter
+from .importer import CatalogImporter, get_format, read_rows
+from .inventory import StockUpdater
+from .reservations import commit_reservation, release_reservation, reserve_stock
+from .shards import clear_shards
 from .inputs import (
     AttributeInput, BusinessCardInput, BrandInput, CategoryInput,
-    CommentInput, TypeInput, ProductInput, SubProductInput, StockInput
+    CommentInput, TypeInput, ProductInput, SubProductInput, StockInput, StockItemInput
 )
 from .models import (
     Attribute, Brand, BusinessCard, BusinessCardImage, Category,
     Comment, Product, SubProduct, Stock, Type, SubProductImage
 )
+from .suggestions import indexes
 from .tools import (
     ProductData
 )
 from .types import (
     BusinessCardType, BusinessCardImageType, BrandType, CategoryType, TypeNode,
-    CommentType, ProductType, SubProductType, StockType, AttributeType, SubProductImageType
+    CommentType, ProductType, SubProductType, StockType, AttributeType, SubProductImageType,
+    SuggestionKind, SuggestionType, ProductFacetsType, ImportErrorType, StockReservationType
 )
 
 
@@ -42,7 +56,7 @@ class CreateBusinessCard(graphene.Mutation):
         )
 
 
-class UpdateBusinessCard(graphene.Mutation):
+class UpdateBusinessCard(UpdateMutation):
     """Updating the user's business card."""
     business_card = graphene.Field(BusinessCardType)
 
@@ -51,17 +65,15 @@ class UpdateBusinessCard(graphene.Mutation):
 
     @is_authenticated
     def mutate(self, info, business_card_data):
-        try:
-            business_card_id = info.context.user.business_card.id
-        except Exception:
-            raise Exception("You doesn't have a business card to update!")
-
-        BusinessCard.objects.filter(
-            id=business_card_id
-        ).update(**business_card_data)
+        with transaction.atomic():
+            business_card = UpdateBusinessCard.get_for_update(
+                BusinessCard.objects.filter(user_id=info.context.user.id),
+                "You doesn't have a business card to update!"
+            )
+            UpdateBusinessCard.save_changes(business_card, business_card_data)
 
         return UpdateBusinessCard(
-            business_card=BusinessCard.objects.get(id=business_card_id)
+            business_card=business_card
         )
 
 
@@ -123,17 +135,9 @@ class CreateProduct(graphene.Mutation):
         except Exception:
             raise Exception("You don't have a business card to create product!")
 
-        have_product = Product.objects.filter(
-            card=business_card,
-            name=product_data.get('name')
-        )
-
-        if have_product:
-            raise Exception("You already have a product with this name!")
-
-        brands = ProductData.get_brands(product_data=brands)
-        categories = ProductData.get_categories(product_data=categories)
-        product_type = ProductData.get_type(product_data=type)
+        brands = ProductData.get_brands(product_data=brands, context=info.context)
+        categories = ProductData.get_categories(product_data=categories, context=info.context)
+        product_type = ProductData.get_type(product_data=type, context=info.context)
 
         if not brands:
             raise Exception(_("Brand input field empty! Enter an existing brands!"))
@@ -141,14 +145,16 @@ class CreateProduct(graphene.Mutation):
         if not categories:
             raise Exception(_("Category input field empty! Enter an existing categories!"))
 
-        product_instance = Product.objects.create(
-            card=business_card,
-            type=product_type,
-            **product_data
-        )
+        duplicates = Product.objects.filter(card=business_card, name=product_data.get('name'))
+        with unique_violation(duplicates, "You already have a product with this name!"):
+            product_instance = Product.objects.create(
+                card=business_card,
+                type=product_type,
+                **product_data
+            )
 
-        product_instance.brand.set(brands)
-        product_instance.category.set(categories)
+            product_instance.brand.set(brands)
+            product_instance.category.set(categories)
 
         return CreateProduct(
             product=product_instance,
@@ -156,7 +162,7 @@ class CreateProduct(graphene.Mutation):
         )
 
 
-class UpdateProduct(graphene.Mutation):
+class UpdateProduct(UpdateMutation):
     """Updating a product."""
     product = graphene.Field(ProductType)
     status = graphene.Boolean()
@@ -170,27 +176,9 @@ class UpdateProduct(graphene.Mutation):
 
     @is_authenticated
     def mutate(self, info, brands, categories, type, product_data, product_id):
-        try:
-            business_card = info.context.user.business_card
-        except Exception:
-            raise Exception("You don't have a business card to create product!")
-
-        try:
-            Product.objects.get(id=product_id, card=business_card)
-        except Product.DoesNotExist:
-            return Exception("Create product before update!")
-
-        have_product = Product.objects.filter(
-            card=business_card,
-            name=product_data.get('name')
-        ).exclude(id=product_id)
-
-        if have_product:
-            raise Exception("You already have a product with this name")
-
-        brands = ProductData.get_brands(product_data=brands)
-        categories = ProductData.get_categories(product_data=categories)
-        product_type = ProductData.get_type(product_data=type)
+        brands = ProductData.get_brands(product_data=brands, context=info.context)
+        categories = ProductData.get_categories(product_data=categories, context=info.context)
+        product_type = ProductData.get_type(product_data=type, context=info.context)
 
         if not brands:
             raise Exception(_("Brand input field empty! Enter an existing brands!"))
@@ -198,18 +186,22 @@ class UpdateProduct(graphene.Mutation):
         if not categories:
             raise Exception(_("Category input field empty! Enter an existing categories!"))
 
-        Product.objects.filter(
-            id=product_id,
-        ).update(
-            **product_data,
-            type=product_type
-        )
+        with transaction.atomic():
+            product_instance = UpdateProduct.get_for_update(
+                Product.objects.filter(id=product_id, card__user_id=info.context.user.id),
+                "Create product before update!"
+            )
+
+            duplicates = Product.objects.filter(
+                card_id=product_instance.card_id,
+                name=product_data.get('name')
+            ).exclude(id=product_id)
+            with unique_violation(duplicates, "You already have a product with this name"):
+                UpdateProduct.save_changes(product_instance, {**product_data, 'type': product_type})
 
-        product_instance = Product.objects.get(id=product_id)
-        product_instance.brand.clear()
-        product_instance.brand.set(brands)
-        product_instance.category.clear()
-        product_instance.category.set(categories)
+            # set() only deletes and inserts the changed links
+            product_instance.brand.set(brands)
+            product_instance.category.set(categories)
 
         return UpdateProduct(
             product=product_instance,
@@ -236,6 +228,43 @@ class DeleteProduct(graphene.Mutation):
         )
 
 
+class BulkImportProducts(graphene.Mutation):
+    """Importing products with sub-products, stocks and attributes from a CSV or JSONL file."""
+    status = graphene.Boolean()
+    rows = graphene.Int()
+    products = graphene.Int()
+    sub_products = graphene.Int()
+    error_count = graphene.Int()
+    errors = graphene.List(ImportErrorType)
+
+    class Arguments:
+        file = Upload(required=True)
+        format = graphene.String()
+        batch_size = graphene.Int()
+
+    @is_authenticated
+    def mutate(self, info, file, format=None, batch_size=None):
+        try:
+            business_card = info.context.user.business_card
+        except Exception:
+            raise Exception("You don't have a business card to import products!")
+
+        if batch_size is not None and batch_size < 1:
+            raise Exception("Batch size must be positive!")
+
+        rows = read_rows(io.TextIOWrapper(file, encoding='utf-8', newline=''), format or get_format(file.name))
+        importer = CatalogImporter(business_card, batch_size=batch_size).run(rows)
+
+        return BulkImportProducts(
+            status=not importer.error_count,
+            rows=importer.rows,
+            products=importer.products,
+            sub_products=importer.sub_products,
+            error_count=importer.error_count,
+            errors=[ImportErrorType(line=line, message=message) for line, message in importer.errors],
+        )
+
+
 class CreateSubProduct(graphene.Mutation):
     """Creating a sub-product."""
     sub_product = graphene.Field(SubProductType)
@@ -257,17 +286,12 @@ class CreateSubProduct(graphene.Mutation):
         except Product.DoesNotExist:
             return Exception("Create product before creating sub-product!")
 
-        have_sub_product = SubProduct.objects.filter(
-            product_id=product_id,
-            sku=sub_product_data.get('sku')
-        )
-        if have_sub_product:
-            raise Exception("You already have a sub-product with this product code")
-
-        sub_product_instance = SubProduct.objects.create(
-            product_id=product_id,
-            **sub_product_data
-        )
+        duplicates = SubProduct.objects.filter(product_id=product_id, sku=sub_product_data.get('sku'))
+        with unique_violation(duplicates, "You already have a sub-product with this product code"):
+            sub_product_instance = SubProduct.objects.create(
+                product_id=product_id,
+                **sub_product_data
+            )
 
         return CreateSubProduct(
             sub_product=sub_product_instance,
@@ -275,7 +299,7 @@ class CreateSubProduct(graphene.Mutation):
         )
 
 
-class UpdateSubProduct(graphene.Mutation):
+class UpdateSubProduct(UpdateMutation):
     """Updating a sub-product."""
     sub_product = graphene.Field(SubProductType)
     status = graphene.Boolean()
@@ -287,36 +311,26 @@ class UpdateSubProduct(graphene.Mutation):
 
     @is_authenticated
     def mutate(self, info, product_id, sub_product_id, sub_product_data):
-        try:
-            business_card = info.context.user.business_card
-        except Exception:
-            raise Exception("You don't have a business card to create sub-product!")
-
-        try:
-            Product.objects.get(id=product_id, card=business_card)
-        except Product.DoesNotExist:
-            return Exception("Create a product before updating sub-product!")
-
-        try:
-            SubProduct.objects.get(id=sub_product_id, product_id=product_id)
-        except SubProduct.DoesNotExist:
-            return Exception("Create a sub-product before updating!")
-
-        have_sub_product = SubProduct.objects.filter(
-            product_id=product_id,
-            sku=sub_product_data.get('sku')
-        ).exclude(
-            id=sub_product_id
-        )
-        if have_sub_product:
-            raise Exception("You already have a sub-product with this product code")
+        with transaction.atomic():
+            sub_product = UpdateSubProduct.get_for_update(
+                SubProduct.objects.filter(
+                    id=sub_product_id, product_id=product_id, product__card__user_id=info.context.user.id
+                ),
+                "Create a sub-product before updating!"
+            )
 
-        SubProduct.objects.filter(id=sub_product_id).update(
-            **sub_product_data
-        )
+            duplicates = SubProduct.objects.filter(
+                product_id=product_id,
+                sku=sub_product_data.get('sku')
+            ).exclude(
+                id=sub_product_id
+            )
+            # The signals of the save refresh the aggregates of the product
+            with unique_violation(duplicates, "You already have a sub-product with this product code"):
+                UpdateSubProduct.save_changes(sub_product, sub_product_data)
 
         return UpdateSubProduct(
-            sub_product=SubProduct.objects.get(id=sub_product_id),
+            sub_product=sub_product,
             status=True
         )
 
@@ -375,7 +389,7 @@ class CreateStock(graphene.Mutation):
         )
 
 
-class UpdateStock(graphene.Mutation):
+class UpdateStock(UpdateMutation):
     """Updating a stock."""
     stock = graphene.Field(StockType)
     status = graphene.Boolean()
@@ -387,26 +401,57 @@ class UpdateStock(graphene.Mutation):
 
     @is_authenticated
     def mutate(self, info, sub_product_id, stock_id, stock_data):
-        try:
-            info.context.user.business_card
-        except Exception:
-            raise Exception("You don't have a business card to create sub-product!")
+        with transaction.atomic():
+            stock = UpdateStock.get_for_update(
+                Stock.objects.filter(
+                    id=stock_id,
+                    sub_product_id=sub_product_id,
+                    sub_product__product__card__user_id=info.context.user.id
+                ),
+                "Create stock before updating!"
+            )
 
-        try:
-            SubProduct.objects.get(id=sub_product_id)
-        except Product.DoesNotExist:
-            return Exception("Create a sub-product before creating stock!")
+            # The signals of the save refresh the aggregates of the product, without a changed
+            # field only the shards set to the absolute values need it
+            cleared = clear_shards([stock.id], stock_data)
+            if not UpdateStock.save_changes(stock, stock_data) and cleared:
+                Product.objects.filter(sub_product__id=sub_product_id).refresh_aggregates()
+                transaction.on_commit(lambda: invalidate_models(Stock, Product))
+
+        return UpdateStock(
+            stock=stock,
+            status=True
+        )
+
+
+class BulkUpdateStock(graphene.Mutation):
+    """Updating stocks of many sub-products by sku or id in one transaction."""
+    status = graphene.Boolean()
+    updated = graphene.Int()
+    created = graphene.Int()
+    error_count = graphene.Int()
+    errors = graphene.List(ImportErrorType)
+
+    class Arguments:
+        items = graphene.List(graphene.NonNull(StockItemInput), required=True)
 
+    @is_authenticated
+    def mutate(self, info, items):
         try:
-            Stock.objects.get(id=stock_id, sub_product_id=sub_product_id)
-        except Stock.DoesNotExist:
-            return Exception("Create stock before updating!")
+            business_card = info.context.user.business_card
+        except Exception:
+            raise Exception("You don't have a business card to update stocks!")
 
-        Stock.objects.filter(id=stock_id).update(**stock_data)
+        updater = StockUpdater(business_card).run(
+            (line, dict(item)) for line, item in enumerate(items, 1)
+        )
 
-        return UpdateStock(
-            stock=Stock.objects.get(id=stock_id),
-            status=True
+        return BulkUpdateStock(
+            status=not updater.error_count,
+            updated=updater.updated,
+            created=updater.created,
+            error_count=updater.error_count,
+            errors=[ImportErrorType(line=line, message=message) for line, message in updater.errors],
         )
 
 
@@ -428,6 +473,49 @@ class DeleteStock(graphene.Mutation):
         return DeleteStock(status=True)
 
 
+class ReserveStock(graphene.Mutation):
+    """Taking units of a sub-product from the stock until the reservation is committed or released."""
+    reservation = graphene.Field(StockReservationType)
+    status = graphene.Boolean()
+
+    class Arguments:
+        sub_product_id = graphene.ID(required=True)
+        quantity = graphene.Int(required=True)
+
+    @is_authenticated
+    def mutate(self, info, sub_product_id, quantity):
+        reservation = reserve_stock(info.context.user, sub_product_id, quantity)
+        return ReserveStock(reservation=reservation, status=True)
+
+
+class CommitReservation(graphene.Mutation):
+    """Counting the reserved units as sold."""
+    reservation = graphene.Field(StockReservationType)
+    status = graphene.Boolean()
+
+    class Arguments:
+        reservation_id = graphene.ID(required=True)
+
+    @is_authenticated
+    def mutate(self, info, reservation_id):
+        reservation = commit_reservation(info.context.user, reservation_id)
+        return CommitReservation(reservation=reservation, status=True)
+
+
+class ReleaseReservation(graphene.Mutation):
+    """Giving the reserved units back to the stock."""
+    reservation = graphene.Field(StockReservationType)
+    status = graphene.Boolean()
+
+    class Arguments:
+        reservation_id = graphene.ID(required=True)
+
+    @is_authenticated
+    def mutate(self, info, reservation_id):
+        reservation = release_reservation(info.context.user, reservation_id)
+        return ReleaseReservation(reservation=reservation, status=True)
+
+
 class CreateAttribute(graphene.Mutation):
     """Creating an attribute."""
     attribute = graphene.Field(AttributeType)
@@ -449,22 +537,20 @@ class CreateAttribute(graphene.Mutation):
         except SubProduct.DoesNotExist:
             return Exception("Create a sub-product before creating attribute!")
 
-        have_attribute = Attribute.objects.filter(
+        duplicates = Attribute.objects.filter(
             sub_product_id=sub_product_id,
             name=attribute_data.get('name'),
             value=attribute_data.get('value')
         )
-        if have_attribute:
-            raise Exception("You already have that attributes with this sub-product!")
-
-        attribute_instance = Attribute.objects.create(
-            sub_product_id=sub_product_id, **attribute_data
-        )
+        with unique_violation(duplicates, "You already have that attributes with this sub-product!"):
+            attribute_instance = Attribute.objects.create(
+                sub_product_id=sub_product_id, **attribute_data
+            )
 
         return CreateAttribute(attribute=attribute_instance, status=True)
 
 
-class UpdateAttribute(graphene.Mutation):
+class UpdateAttribute(UpdateMutation):
     """Updating an attribute."""
     attribute = graphene.Field(AttributeType)
     status = graphene.Boolean()
@@ -476,32 +562,25 @@ class UpdateAttribute(graphene.Mutation):
 
     @is_authenticated
     def mutate(self, info, attribute_data, attribute_id, sub_product_id):
-        try:
-            info.context.user.business_card
-        except Exception:
-            raise Exception("You don't have a business card to create sub-product!")
-
-        try:
-            sub_product = SubProduct.objects.get(id=sub_product_id)
-        except SubProduct.DoesNotExist:
-            return Exception("Create a sub-product and his attribute before updating!")
-
-        try:
-            attribute = Attribute.objects.get(id=attribute_id)
-        except Attribute.DoesNotExist:
-            return Exception("Creating a attribute before updating!")
-
-        have_attribute = Attribute.objects.filter(
-            sub_product_id=sub_product_id,
-            name=attribute_data.get('name'),
-            value=attribute_data.get('value')
-        ).exclude(id=attribute_id)
-        if have_attribute:
-            raise Exception("You already have that attributes with this sub-product!")
+        with transaction.atomic():
+            attribute = UpdateAttribute.get_for_update(
+                Attribute.objects.filter(
+                    id=attribute_id,
+                    sub_product_id=sub_product_id,
+                    sub_product__product__card__user_id=info.context.user.id
+                ),
+                "Creating a attribute before updating!"
+            )
 
-        Attribute.objects.filter(id=attribute_id).update(**attribute_data)
+            duplicates = Attribute.objects.filter(
+                sub_product_id=sub_product_id,
+                name=attribute_data.get('name'),
+                value=attribute_data.get('value')
+            ).exclude(id=attribute_id)
+            with unique_violation(duplicates, "You already have that attributes with this sub-product!"):
+                UpdateAttribute.save_changes(attribute, attribute_data)
 
-        return UpdateAttribute(attribute=Attribute.objects.get(id=attribute_id), status=True)
+        return UpdateAttribute(attribute=attribute, status=True)
 
 
 class DeleteAttribute(graphene.Mutation):
@@ -532,30 +611,26 @@ class CreateComment(graphene.Mutation):
 
     @is_authenticated
     def mutate(self, info, comment_data, sub_product_id):
-        business_card = info.context.user.business_card
         user_id = info.context.user.id
 
-        if business_card:
-            own_sub_product = SubProduct.objects.filter(
-                id=sub_product_id, product__card=business_card
-            )
-            if own_sub_product:
-                raise Exception("You can't comment on own product!")
-
-        have_comment = Comment.objects.filter(user_id=user_id, sub_product_id=sub_product_id)
-
-        if have_comment.exists():
-            raise Exception("You have already reviewed this product!")
-
-        comment_instance = Comment.objects.create(
-            sub_product_id=sub_product_id,
-            user_id=user_id, **comment_data
+        # One query, users without a business card have no own products
+        own_sub_product = SubProduct.objects.filter(
+            id=sub_product_id, product__card__user_id=user_id
         )
+        if own_sub_product.exists():
+            raise Exception("You can't comment on own product!")
+
+        duplicates = Comment.objects.filter(user_id=user_id, sub_product_id=sub_product_id)
+        with unique_violation(duplicates, "You have already reviewed this product!"):
+            comment_instance = Comment.objects.create(
+                sub_product_id=sub_product_id,
+                user_id=user_id, **comment_data
+            )
 
         return CreateComment(status=True, comment=comment_instance)
 
 
-class UpdateComment(graphene.Mutation):
+class UpdateComment(UpdateMutation):
     """Updating a comment."""
     comment = graphene.Field(CommentType)
     status = graphene.Boolean()
@@ -567,17 +642,20 @@ class UpdateComment(graphene.Mutation):
 
     @is_authenticated
     def mutate(self, info, comment_id, comment_data, sub_product_id):
-        try:
-            Comment.objects.get(id=comment_id)
-        except Comment.DoesNotExist:
-            raise Exception(_("Create comment before update!"))
+        with transaction.atomic():
+            comment = UpdateComment.get_for_update(
+                Comment.objects.filter(
+                    id=comment_id, user__id=info.context.user.id, sub_product_id=sub_product_id
+                ),
+                _("Create comment before update!")
+            )
 
-        Comment.objects.filter(
-            id=comment_id, user__id=info.context.user.id, sub_product_id=sub_product_id
-        ).update(**comment_data)
+            # Saved through the model to keep the rating of the sub-product in step,
+            # the locked row is the stored version it takes back
+            UpdateComment.save_changes(comment, comment_data, previous=copy(comment))
 
         return UpdateComment(
-            comment=Comment.objects.get(id=comment_id),
+            comment=comment,
             status=True
         )
 
@@ -592,9 +670,11 @@ class DeleteComment(graphene.Mutation):
 
     @is_authenticated
     def mutate(self, info, comment_id, sub_product_id):
-        Comment.objects.filter(
+        comment = Comment.objects.filter(
             id=comment_id, user__id=info.context.user.id, sub_product_id=sub_product_id
-        ).delete()
+        ).first()
+        if comment is not None:
+            comment.delete()
         return DeleteComment(status=True)
 
 
@@ -674,6 +754,7 @@ class Mutation(graphene.ObjectType):
     create_product = CreateProduct.Field()
     update_product = UpdateProduct.Field()
     delete_product = DeleteProduct.Field()
+    bulk_import_products = BulkImportProducts.Field()
 
     create_sub_product = CreateSubProduct.Field()
     update_sub_product = UpdateSubProduct.Field()
@@ -682,6 +763,11 @@ class Mutation(graphene.ObjectType):
     create_stock = CreateStock.Field()
     update_stock = UpdateStock.Field()
     delete_stock = DeleteStock.Field()
+    bulk_update_stock = BulkUpdateStock.Field()
+
+    reserve_stock = ReserveStock.Field()
+    commit_reservation = CommitReservation.Field()
+    release_reservation = ReleaseReservation.Field()
 
     create_attribute = CreateAttribute.Field()
     update_attribute = UpdateAttribute.Field()
@@ -707,12 +793,12 @@ class Query(graphene.ObjectType):
 
     @staticmethod
     def resolve_brands(cls, info, name=False):
-        query = Brand.objects.prefetch_related('product_brands')
+        query = Brand.objects.all()
 
         if name:
             query = query.filter(Q(name__icontains=name) | Q(name__iexact=name)).distinct()
 
-        return query
+        return optimize_queryset(query, info)
 
     categories = graphene.List(
         CategoryType,
@@ -722,12 +808,12 @@ class Query(graphene.ObjectType):
 
     @staticmethod
     def resolve_categories(cls, info, name=False):
-        query = Category.objects.prefetch_related('product_categories')
+        query = Category.objects.all()
 
         if name:
             query = query.filter(Q(name__icontains=name) | Q(name__iexact=name)).distinct()
 
-        return query
+        return optimize_queryset(query, info)
 
     types = graphene.List(
         TypeNode,
@@ -737,86 +823,52 @@ class Query(graphene.ObjectType):
 
     @staticmethod
     def resolve_types(cls, info, name=False):
-        query = Type.objects.prefetch_related('product_types')
+        query = Type.objects.all()
 
         if name:
             query = query.filter(Q(name__icontains=name) | Q(name__iexact=name)).distinct()
 
-        return query
+        return optimize_queryset(query, info)
 
-    products = graphene.Field(
-        paginate(ProductType), search=graphene.String(), min_price=graphene.Float(),
-        max_price=graphene.Float(), brand=graphene.String(), category=graphene.String(),
-        type_of_product=graphene.String(), business_card=graphene.String(), sort_by=graphene.String(),
-        is_asc=graphene.Boolean(), mine=graphene.Boolean(), min_rating=graphene.Float(),
-        max_rating=graphene.Boolean(), description='Response data paginated about existing products.'
+    suggestions = graphene.List(
+        SuggestionType,
+        kind=SuggestionKind(required=True),
+        prefix=graphene.String(required=True),
+        limit=graphene.Int(),
+        description='Response brands, categories or types which names start with the prefix.'
+    )
+
+    @staticmethod
+    def resolve_suggestions(cls, info, kind, prefix, limit=10):
+        limit = min(max(limit, 0), 50)
+
+        return [
+            SuggestionType(id=pk, name=name)
+            for pk, name in indexes[kind].search(prefix, limit)
+        ]
+
+    products = PaginatedField(
+        ProductType, cursor=True, fields={'facets': graphene.Field(ProductFacetsType, resolver=resolve_queryset)},
+        search=graphene.String(), min_price=graphene.Float(), max_price=graphene.Float(),
+        brand=graphene.String(), category=graphene.String(), type_of_product=graphene.String(),
+        business_card=graphene.String(), sort_by=graphene.String(), is_asc=graphene.Boolean(),
+        mine=graphene.Boolean(), min_rating=graphene.Float(), max_rating=graphene.Float(),
+        description='Response data paginated about existing products.'
     )
 
     @staticmethod
     def resolve_products(cls, info, **kwargs):
 
-        mine = kwargs.get('mine', False)
-        if mine and not info.context.user:
+        mine = kwargs.pop('mine', False)
+        if mine and not info.context.user.is_authenticated:
             raise Exception('User auth required!')
 
-        query = Product.objects.select_related('card', 'type').prefetch_related(
-            'brand', 'category', 'sub_product', 'sub_product__attributes',
-            'sub_product__comments', 'sub_product__stock'
-        )
+        query = Product.objects.all()
 
         if mine:
-            query = query.filter(card_id=info.context.user.id)
-
-        if kwargs.get('search', None):
-            qs = kwargs['search']
-            search_fields = (
-                'name', 'description'
-            )
-            search_data = get_query(qs, search_fields)
-            query = query.filter(search_data)
-
-        if kwargs.get('min_price', None):
-            qs = kwargs['min_price']
-            q = Product.objects.filter(sub_product__sale_price__qt=qs)
-
-            query = query.filter(Q(sub_product__sale_price__qt=qs) | Q(sub_product__sale_price=qs)).distinct()
+            query = query.filter(card__user_id=info.context.user.id)
 
-        if kwargs.get('max_price', None):
-            qs = kwargs['max_price']
-            query = query.filter(Q(sub_product__sale_price__lt=qs) | Q(sub_product__sale_price=qs)).distinct()
-
-        if kwargs.get('brand', None):
-            qs = kwargs['brand']
-            query = query.filter(Q(brand__name__icontains=qs) | Q(brand__name__iexact=qs)).distinct()
-
-        if kwargs.get('category', None):
-            qs = kwargs['category']
-            query = query.filter(Q(category__name__icontains=qs) | Q(category__name__iexact=qs)).distinct()
-
-        if kwargs.get('type_of_product', None):
-            qs = kwargs['type_of_product']
-            query = query.filer(Q(type__name__icontains=qs) | Q(type__name__iexact=qs)).distinc()
-
-        if kwargs.get('business_card', None):
-            qs = kwargs['business_card']
-            query = query.filer(Q(card__name__icontains=qs) | Q(card__name__iexact=qs)).distinct()
-
-        if kwargs.get('sort_by', None):
-            qs = kwargs['sort_by']
-            is_asc = kwargs.get('is_asc', False)
-            if not is_asc:
-                qs = f"-{qs}"
-            query = query.order_by(qs)
-
-        if kwargs.get('min_rating', None):
-            qs = kwargs['min_rating']
-            query = query.filter(Q(sub_product__avg_rating__qt=qs) | Q(sub_product__avg_rating__iexact=qs)).distinct()
-
-        if kwargs.get('max_price', None):
-            qs = kwargs['max_rating']
-            query = query.filter(Q(sub_product__avg_rating__lt=qs) | Q(sub_product__avg_rating=qs)).distinct()
-
-        return query
+        return ProductFilter(**kwargs).filter(query)
 
     product = graphene.Field(
         ProductType,
@@ -826,10 +878,7 @@ class Query(graphene.ObjectType):
 
     @staticmethod
     def resolve_product(cls, info, id):
-        query = Product.objects.select_related('card', 'type').prefetch_related(
-            'brand', 'category', 'sub_product', 'sub_product__attributes',
-            'sub_product__comments', 'sub_product__stock'
-        ).get(id=id)
+        query = optimize_queryset(Product.objects.all(), info).get(id=id)
 
         return query
 
@@ -0,0 +1,159 @@
+from django.conf import settings
+from django.db import connection
+from django.db.models import FloatField, Value
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from backend.permissions import get_query, normalize_query
+from .models import Product
+
+
+class SearchBackend:
+    """
+    Search engine behind the `search` argument of the products query
+    """
+
+    def filter(self, queryset, search):
+        """Products matching the search string"""
+        raise NotImplementedError
+
+    def annotate_rank(self, queryset, search):
+        """Annotate products with `search_rank`, bigger is more relevant"""
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+    def install(self):
+        """Create database objects of the search index"""
+
+    def rebuild(self):
+        """Fill the search index with the existing products"""
+
+
+class ContainsSearchBackend(SearchBackend):
+    """
+    Search by `icontains` of every term in name and description,
+    works everywhere but scans the whole table
+    """
+
+    search_fields = ('name', 'description')
+
+    def filter(self, queryset, search):
+        return queryset.filter(get_query(search, self.search_fields))
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """
+    Search by the SQLite FTS5 virtual table over name and description,
+    kept in sync with the product table by triggers
+    """
+
+    table = f'{Product._meta.db_table}_fts'
+
+    def get_match(self, search):
+        """FTS5 query where every term must match as a prefix"""
+        terms = ['"%s"*' % term.replace('"', '""') for term in normalize_query(search)]
+        return ' '.join(terms) or '""'
+
+    def filter(self, queryset, search):
+        return queryset.filter(id__in=RawSQL(
+            f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s',
+            (self.get_match(search),)
+        ))
+
+    def annotate_rank(self, queryset, search):
+        # bm25() is smaller for better matches, name matches weigh more than description
+        return queryset.annotate(search_rank=RawSQL(
+            f'SELECT -bm25({self.table}, 10.0, 1.0) FROM {self.table} '
+            f'WHERE {self.table} MATCH %s AND rowid = "{Product._meta.db_table}"."id"',
+            (self.get_match(search),),
+            output_field=FloatField()
+        ))
+
+    def install(self):
+        products = Product._meta.db_table
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", (self.table,))
+            created = cursor.fetchone() is None
+
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5("
+                f"name, description, content='{products}', content_rowid='id', "
+                f"tokenize='unicode61 remove_diacritics 2')"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {self.table}_insert AFTER INSERT ON {products} BEGIN "
+                f"INSERT INTO {self.table}(rowid, name, description) VALUES (new.id, new.name, new.description); "
+                f"END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {self.table}_delete AFTER DELETE ON {products} BEGIN "
+                f"INSERT INTO {self.table}({self.table}, rowid, name, description) "
+                f"VALUES ('delete', old.id, old.name, old.description); "
+                f"END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {self.table}_update "
+                f"AFTER UPDATE OF name, description ON {products} BEGIN "
+                f"INSERT INTO {self.table}({self.table}, rowid, name, description) "
+                f"VALUES ('delete', old.id, old.name, old.description); "
+                f"INSERT INTO {self.table}(rowid, name, description) VALUES (new.id, new.name, new.description); "
+                f"END"
+            )
+
+        if created:
+            self.rebuild()
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {self.table}({self.table}) VALUES ('rebuild')")
+
+
+class PostgresSearchBackend(SearchBackend):
+    """
+    Search by PostgreSQL tsvector of name (weight A) and description (weight B),
+    stored in a generated column of the product table with a GIN index
+    """
+
+    config = 'english'
+    column = 'search_vector'
+
+    def get_vector(self):
+        from django.contrib.postgres.search import SearchVectorField
+
+        return RawSQL(f'"{Product._meta.db_table}"."{self.column}"', (), output_field=SearchVectorField())
+
+    def get_query(self, search):
+        from django.contrib.postgres.search import SearchQuery
+
+        return SearchQuery(search, search_type='websearch', config=self.config)
+
+    def filter(self, queryset, search):
+        return queryset.alias(search_vector=self.get_vector()).filter(search_vector=self.get_query(search))
+
+    def annotate_rank(self, queryset, search):
+        from django.contrib.postgres.search import SearchRank
+
+        return queryset.annotate(search_rank=SearchRank(self.get_vector(), self.get_query(search)))
+
+    def install(self):
+        products = Product._meta.db_table
+
+        # The generated column is computed by PostgreSQL on every write, so it is never out of sync
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"ALTER TABLE {products} ADD COLUMN IF NOT EXISTS {self.column} tsvector "
+                f"GENERATED ALWAYS AS ("
+                f"setweight(to_tsvector('{self.config}'::regconfig, coalesce(name, '')), 'A') || "
+                f"setweight(to_tsvector('{self.config}'::regconfig, coalesce(description, '')), 'B')"
+                f") STORED"
+            )
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {products}_{self.column}_gin ON {products} USING GIN ({self.column})"
+            )
+
+
+def get_search_backend():
+    """Search backend from the PRODUCT_SEARCH_BACKEND setting"""
+    return import_string(
+        getattr(settings, 'PRODUCT_SEARCH_BACKEND', 'product.search.ContainsSearchBackend')
+    )()
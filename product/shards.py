@@ -0,0 +1,72 @@
+import random
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import Stock, StockShard
+
+SHARDED_FIELDS = ('units', 'units_sold')
+
+
+def move_shard_units(stock_id, shard_count, units, units_sold=0):
+    """
+    Add units (negative to take them) to a random shard of the stock. Units are taken
+    from a shard holding enough of them, when they are spread over several shards
+    they are folded together under the lock of the stock row
+    """
+    changes = {'units': F('units') + units}
+    if units_sold:
+        changes['units_sold'] = F('units_sold') + units_sold
+
+    if units >= 0:
+        shard = StockShard.objects.filter(stock_id=stock_id, shard=random.randrange(shard_count))
+        # Shard rows are missing only until the next compaction, the stock row takes the units meanwhile
+        return bool(shard.update(**changes) or Stock.objects.filter(id=stock_id).update(**changes))
+
+    for shard in random.sample(range(shard_count), shard_count):
+        if StockShard.objects.filter(stock_id=stock_id, shard=shard, units__gte=-units).update(**changes):
+            return True
+
+    if Stock.objects.filter(id=stock_id, units__gte=-units).update(**changes):
+        return True
+    return compact_stock(stock_id, units, units_sold)
+
+
+def compact_stock(stock_id, units=0, units_sold=0):
+    """
+    Fold the shards of the stock into its row and spread the units evenly over `shard_count`
+    shards again, applying the change of units under the lock. Returns False when the
+    stock doesn't have enough units to take
+    """
+    with transaction.atomic():
+        stock = Stock.objects.select_for_update().filter(id=stock_id).first()
+        if stock is None:
+            return False
+        # Locked in the order of the shard numbers, like every other compaction
+        shards = list(StockShard.objects.select_for_update().filter(stock_id=stock_id).order_by('shard'))
+
+        total = stock.units + sum(shard.units for shard in shards) + units
+        if units < 0 and total < 0:
+            return False
+        sold = stock.units_sold + sum(shard.units_sold for shard in shards) + units_sold
+
+        count = stock.shard_count
+        share = max(total, 0) // count if count else 0
+        Stock.objects.filter(id=stock_id).update(units=total - share * count, units_sold=sold)
+
+        StockShard.objects.filter(stock_id=stock_id, shard__gte=count).delete()
+        StockShard.objects.filter(stock_id=stock_id).update(units=share, units_sold=0)
+        existing = {shard.shard for shard in shards}
+        StockShard.objects.bulk_create([
+            StockShard(stock_id=stock_id, shard=shard, units=share)
+            for shard in range(count) if shard not in existing
+        ])
+        return True
+
+
+def clear_shards(stock_ids, fields):
+    """Zero the shards of the stocks for the counters set to absolute values, returns the number of shards"""
+    fields = [field for field in fields if field in SHARDED_FIELDS]
+    if not fields:
+        return 0
+    return StockShard.objects.filter(stock_id__in=stock_ids).update(**{field: 0 for field in fields})
@@ -0,0 +1,60 @@
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from backend.cache import invalidate_models
+from .models import (
+    Attribute, Brand, BusinessCard, BusinessCardImage, Category, Comment, Product, Stock, SubProduct,
+    SubProductImage, Type,
+)
+
+
+@receiver([post_save, post_delete], sender=SubProduct)
+def refresh_sub_product_aggregates(sender, instance, **kwargs):
+    """Keep the price, rating and stock aggregates of the product in step with its sub-products"""
+    Product.objects.filter(id=instance.product_id).refresh_aggregates()
+
+
+@receiver([post_save, post_delete], sender=Stock)
+def refresh_stock_aggregates(sender, instance, **kwargs):
+    """Keep the units in stock of the product in step with the stocks of its sub-products"""
+    Product.objects.filter(sub_product__id=instance.sub_product_id).refresh_aggregates()
+
+
+@receiver([post_save, post_delete], sender=BusinessCard)
+@receiver([post_save, post_delete], sender=BusinessCardImage)
+@receiver([post_save, post_delete], sender=Brand)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Type)
+def invalidate_model_cache(sender, **kwargs):
+    """
+    Outdate cached counts, responses and suggestion indexes of the changed table. Products
+    are filtered by these names and cached responses only know the types they select
+    """
+    invalidate_models(sender, Product, SubProduct)
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=SubProduct)
+@receiver([post_save, post_delete], sender=SubProductImage)
+@receiver([post_save, post_delete], sender=Stock)
+@receiver([post_save, post_delete], sender=Attribute)
+@receiver([post_save, post_delete], sender=Comment)
+@receiver(m2m_changed, sender=Product.brand.through)
+@receiver(m2m_changed, sender=Product.category.through)
+def invalidate_product_cache(sender, **kwargs):
+    """
+    Outdate cached product counts and responses when products or their parts change,
+    products are filtered and sorted by their sub-products, comments update the ratings
+    """
+    invalidate_models(sender, Product, SubProduct)
+
+
+@receiver(post_migrate)
+def install_search_index(sender, **kwargs):
+    """Create the product search index after the product tables are migrated"""
+    if sender.name != 'product':
+        return
+
+    from .search import get_search_backend
+
+    get_search_backend().install()
@@ -0,0 +1,71 @@
+import threading
+from bisect import bisect_left
+
+from backend.cache import get_model_tag, get_tags_version
+from .models import Brand, Category, Type
+
+
+class PrefixIndex:
+    """
+    In-memory sorted index of the names of a small table for prefix lookups.
+    Every word of a name starts a key, so "air" finds "Nike Air".
+    The index is rebuilt on the first lookup after the cache tag version of the
+    table changes, which costs every lookup a read of the version from the cache.
+    Changes made by other processes are only seen with a shared cache backend,
+    the default LocMemCache keeps the versions per process.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.tags = [get_model_tag(model)]
+        self.version = None
+        self.entries = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def normalize(text):
+        return ' '.join(text.casefold().split())
+
+    def build(self):
+        entries = []
+        for pk, name in self.model.objects.values_list('pk', 'name'):
+            words = self.normalize(name).split(' ')
+            for index in range(len(words)):
+                entries.append((' '.join(words[index:]), index, name, pk))
+        entries.sort()
+        return [entry[0] for entry in entries], entries
+
+    def get_entries(self):
+        version = get_tags_version(self.tags)
+        if self.version != version:
+            with self.lock:
+                if self.version != version:
+                    # Taken before the build, a change during it rebuilds on the next lookup
+                    self.entries = self.build()
+                    self.version = version
+        return self.entries
+
+    def search(self, prefix, limit=10):
+        """Up to `limit` (pk, name) pairs with a word of the name starting with the prefix"""
+        entries = self.get_entries()
+
+        keys, values = entries
+        prefix = self.normalize(prefix)
+        results, seen = [], set()
+
+        for position in range(bisect_left(keys, prefix), len(keys)):
+            if len(results) >= limit or not keys[position].startswith(prefix):
+                break
+            _, _, name, pk = values[position]
+            if pk not in seen:
+                seen.add(pk)
+                results.append((pk, name))
+
+        return results
+
+
+indexes = {
+    'brand': PrefixIndex(Brand),
+    'category': PrefixIndex(Category),
+    'type': PrefixIndex(Type),
+}
@@ -1 +1,721 @@
-# Create your tests here.
+import datetime
+import json
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from backend.cache import get_model_tag, get_tags_version, invalidate_models
+from backend.schema import schema
+from user.models import User
+from .filters import ProductFilter
+from .importer import CatalogImporter, read_rows
+from .models import (
+    Brand, BusinessCard, Category, Comment, Product, Stock, StockReservation, StockShard, SubProduct, Type,
+)
+from .reservations import commit_reservation, expire_reservations, release_reservation, reserve_stock
+from .shards import compact_stock, move_shard_units
+from .suggestions import PrefixIndex
+
+
+def seed_catalog(products=25):
+    """Products of one business card with two sub-products each"""
+    user = User.object.create_user(
+        email='seller@example.com', password='password', first_name='Seller', last_name='Shop',
+        dob=datetime.date(1990, 1, 1), phone_number='+998901234567', gender='M'
+    )
+    card = BusinessCard.objects.create(
+        user=user, name='Shop', site='http://shop.example.com', phone_number='+998991234567', instagram='shop'
+    )
+    kind = Type.objects.create(name='Shoes')
+    for number in range(products):
+        product = Product.objects.create(card=card, name=f'Product {number:02}', gender='A', type=kind)
+        SubProduct.objects.bulk_create([
+            SubProduct(
+                product=product, sku=f'S{number}-{sub}', retail_price=Decimal(20 + number),
+                sale_price=Decimal(10 + number + sub), store_price=Decimal(15 + number), weight=1.0
+            )
+            for sub in range(2)
+        ])
+    # bulk_create sends no signals to keep the aggregates of the products
+    Product.objects.refresh_aggregates()
+    return card
+
+
+def execute(query, user=None, **variables):
+    request = RequestFactory().post('/graphql')
+    request.user = user or AnonymousUser()
+    response = schema.execute(query, variables=variables, context_value=request)
+    if response.errors:
+        raise response.errors[0]
+    return response.data
+
+
+PRODUCTS_QUERY = '''
+    query($isAsc: Boolean, $after: String, $before: String) {
+        products(sortBy: "created_at", isAsc: $isAsc, after: $after, before: $before) {
+            result { name }
+            hasNext
+            hasPrevious
+            startCursor
+            endCursor
+        }
+    }
+'''
+
+
+PAGE_QUERY = '''
+    query($page: Int) {
+        products(page: $page) {
+            result { name }
+            page
+            pages
+            totalData
+            isEstimated
+            hasNext
+            hasPrevious
+        }
+    }
+'''
+
+
+@override_settings(GRAPHENE={**settings.GRAPHENE, 'PAGE_SIZE': 10})
+class PagePaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog()
+
+    def setUp(self):
+        # Counts are cached by their SQL
+        cache.clear()
+
+    def get_page(self, page):
+        return execute(PAGE_QUERY, page=page)['products']
+
+    def test_exact_count(self):
+        page = self.get_page(2)
+        self.assertEqual((page['totalData'], page['pages'], page['isEstimated']), (25, 3, False))
+        self.assertEqual((len(page['result']), page['hasNext'], page['hasPrevious']), (10, True, True))
+
+        # Pages past the last one show the last page
+        page = self.get_page(9)
+        self.assertEqual((page['page'], len(page['result']), page['hasNext']), (3, 5, False))
+
+    @override_settings(GRAPHENE={**settings.GRAPHENE, 'PAGE_SIZE': 10, 'COUNT_ESTIMATE_THRESHOLD': 5})
+    def test_estimated_count_doesnt_limit_pages(self):
+        page = self.get_page(2)
+        self.assertTrue(page['isEstimated'])
+        self.assertEqual((page['page'], len(page['result']), page['hasNext']), (2, 10, True))
+
+        page = self.get_page(3)
+        self.assertEqual((page['page'], len(page['result']), page['hasNext']), (3, 5, False))
+        self.assertEqual(page['result'][-1]['name'], 'Product 24')
+
+        page = self.get_page(4)
+        self.assertEqual((page['page'], page['result'], page['hasNext'], page['hasPrevious']), (4, [], False, True))
+
+
+class CursorPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog()
+        # Pairs of products created in the same microsecond and rows apart by less than a millisecond
+        start = timezone.now().replace(microsecond=0)
+        for number, product in enumerate(Product.objects.order_by('name')):
+            created_at = start + datetime.timedelta(microseconds=137 * (number // 2))
+            Product.objects.filter(id=product.id).update(created_at=created_at)
+
+    def walk(self, is_asc, before=None):
+        """
+        Names of the products on the pages from the first page on and the cursor of the last
+        row, or with the `before` cursor the names on the pages from the cursor back
+        """
+        names, cursor = [], before
+        for _ in range(Product.objects.count() + 1):
+            if before:
+                page = execute(PRODUCTS_QUERY, isAsc=is_asc, before=cursor)['products']
+                names = [product['name'] for product in page['result']] + names
+                if not page['hasPrevious']:
+                    return names
+                cursor = page['startCursor']
+            else:
+                page = execute(PRODUCTS_QUERY, isAsc=is_asc, after=cursor)['products']
+                names += [product['name'] for product in page['result']]
+                if not page['hasNext']:
+                    return names, page['endCursor']
+                cursor = page['endCursor']
+        self.fail('Pages never end')
+
+    def expected(self, is_asc):
+        products = Product.objects.order_by(*(('created_at', 'id') if is_asc else ('-created_at', '-id')))
+        return [product.name for product in products]
+
+    def test_forward_pages_return_every_product_once(self):
+        for is_asc in (True, False):
+            with self.subTest(is_asc=is_asc):
+                self.assertEqual(self.walk(is_asc)[0], self.expected(is_asc))
+
+    def test_backward_pages_return_every_product_once(self):
+        for is_asc in (True, False):
+            with self.subTest(is_asc=is_asc):
+                # Every row before the last one
+                names, cursor = self.walk(is_asc)
+                self.assertEqual(self.walk(is_asc, before=cursor), self.expected(is_asc)[:-1])
+
+    def test_invalid_cursor(self):
+        for cursor in ('not a cursor', 'W3siZGF0ZXRpbWUiOiJ4In0sMV0='):
+            with self.subTest(cursor=cursor), self.assertRaisesMessage(Exception, 'Invalid cursor!'):
+                execute(PRODUCTS_QUERY, isAsc=True, after=cursor)
+
+
+class SuggestionTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.brand = Brand.objects.create(name='Nike Air')
+        self.index = PrefixIndex(Brand)
+
+    def test_word_prefix(self):
+        self.assertEqual(self.index.search('ai'), [(self.brand.id, 'Nike Air')])
+        self.assertEqual(self.index.search('nike a'), [(self.brand.id, 'Nike Air')])
+        self.assertEqual(self.index.search('adi'), [])
+
+    def test_rebuilt_after_changes_of_other_processes(self):
+        self.assertEqual(self.index.search('nike'), [(self.brand.id, 'Nike Air')])
+
+        # Another process bumps the shared cache tag of the table, its signals don't run here
+        Brand.objects.filter(id=self.brand.id).update(name='Adidas')
+        invalidate_models(Brand)
+
+        self.assertEqual(self.index.search('nike'), [])
+        self.assertEqual(self.index.search('adi'), [(self.brand.id, 'Adidas')])
+
+
+class ProductFilterTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog()
+        nike, adidas = Brand.objects.create(name='Nike'), Brand.objects.create(name='Adidas')
+        categories = [Category.objects.create(name=name) for name in ('Shoes', 'Sport', 'Kids')]
+        for product in Product.objects.all():
+            number = cls.get_number(product.name)
+            product.brand.set([nike if number % 2 else adidas])
+            product.category.set(categories[:1 + number % 3])
+        # Sub-products of a product are rated number % 5 and one more
+        for sub_product in SubProduct.objects.select_related('product'):
+            rating = cls.get_number(sub_product.product.name) % 5 + int(sub_product.sku[-1])
+            SubProduct.objects.filter(id=sub_product.id).update(avg_rating=rating)
+        Product.objects.refresh_aggregates()
+
+    @staticmethod
+    def get_number(name):
+        return int(name.split(' ')[1])
+
+    def filter(self, **kwargs):
+        return ProductFilter(**kwargs).filter(Product.objects.all())
+
+    def get_numbers(self, queryset):
+        return sorted(self.get_number(name) for name in queryset.values_list('name', flat=True))
+
+    def test_filters(self):
+        numbers = range(25)
+        cases = [
+            (dict(brand='nik'), [number for number in numbers if number % 2]),
+            (dict(category='kids'), [number for number in numbers if number % 3 == 2]),
+            (dict(type_of_product='shoe', business_card='shop'), list(numbers)),
+            (dict(brand='adidas', category='sport'), [number for number in numbers if number % 6 in (2, 4)]),
+            # Sale prices are 10 + number and one more
+            (dict(min_price=30), [number for number in numbers if 10 + number + 1 >= 30]),
+            (dict(max_price=12), [number for number in numbers if 10 + number <= 12]),
+            (dict(min_rating=5), [number for number in numbers if number % 5 + 1 >= 5]),
+            # One sub-product rated at most the value is enough
+            (dict(max_rating=1), [number for number in numbers if number % 5 <= 1]),
+            (
+                dict(brand='nike', min_price=20, max_rating=2),
+                [number for number in numbers if number % 2 and 10 + number + 1 >= 20 and number % 5 <= 2]
+            ),
+            (dict(brand='puma'), []),
+        ]
+        for kwargs, expected in cases:
+            with self.subTest(**kwargs):
+                self.assertEqual(self.get_numbers(self.filter(**kwargs)), expected)
+
+    def test_sort(self):
+        names = list(self.filter(sort_by='min_price', is_asc=True).values_list('name', flat=True))
+        self.assertEqual(names, [f'Product {number:02}' for number in range(25)])
+
+        with self.assertRaisesMessage(Exception, "Sorting by price isn't supported"):
+            ProductFilter(sort_by='price')
+
+    @skipUnless(connection.vendor == 'sqlite', 'Query plans are checked on SQLite')
+    def test_flat_query_plans(self):
+        querysets = [
+            self.filter(
+                brand='nike', category='sport', type_of_product='shoe', business_card='shop',
+                min_price=20, max_price=40, min_rating=1, max_rating=4
+            ),
+            *(self.filter(sort_by=sort_by, is_asc=is_asc)
+              for sort_by in ProductFilter.sort_keys if sort_by != 'relevance' for is_asc in (True, False)),
+        ]
+        for queryset in querysets:
+            sql, params = queryset.query.sql_with_params()
+            with self.subTest(sql=sql):
+                self.assertNotIn('DISTINCT', sql)
+                with connection.cursor() as cursor:
+                    cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                    plan = cursor.fetchall()
+
+                # Only the product table is read by the outer query, the filters are subqueries
+                tables = [row[-1] for row in plan if row[1] == 0 and 'SUBQUERY' not in row[-1]]
+                self.assertEqual(len(tables), 1, plan)
+                self.assertRegex(tables[0], r'^(SCAN|SEARCH) product_product\b')
+                self.assertFalse([row for row in plan if 'TEMP B-TREE' in row[-1]], plan)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Query plans are checked on SQLite')
+class ExplainOperationsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog()
+
+    def test_recorded_operations_pass(self):
+        output = StringIO()
+        call_command('explain_operations', fail=True, stdout=output, stderr=output)
+        self.assertIn('0 of ', output.getvalue())
+        self.assertNotIn('error:', output.getvalue())
+
+
+class CatalogImporterTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.card = seed_catalog(products=0)
+        Brand.objects.create(name='Nike')
+        Category.objects.create(name='Sport')
+
+    def get_row(self, **values):
+        row = {
+            'name': 'Runner', 'description': 'Light shoe', 'gender': 'A', 'type': 'Shoes',
+            'brands': ['Nike'], 'categories': ['Sport'], 'sku': 'R-1', 'retail_price': '20',
+            'sale_price': '15', 'store_price': '10', 'weight': '0.5', 'units': '3',
+        }
+        row.update(values)
+        return json.dumps(row)
+
+    def run_import(self, *lines, batch_size=100):
+        importer = CatalogImporter(self.card, batch_size=batch_size)
+        return importer.run(read_rows(StringIO('\n'.join(lines)), 'jsonl'))
+
+    def test_values_of_other_types(self):
+        importer = self.run_import(
+            self.get_row(sku=12345, name=123),
+            self.get_row(gender=1),
+            self.get_row(sku={'code': 1}),
+            self.get_row(sku='R-2', brands='Nike|', categories=7),
+            self.get_row(sku='R-3', attributes=[{'name': 'size', 'value': 42}]),
+            batch_size=2,
+        )
+        self.assertEqual(importer.errors, [
+            (2, 'gender must be one of A, M, F'),
+            (3, 'sku must be text'),
+            (4, 'categories must be a list of names'),
+        ])
+        self.assertEqual((importer.rows, importer.products, importer.sub_products), (5, 2, 2))
+        self.assertTrue(SubProduct.objects.filter(product__name='123', sku='12345').exists())
+        self.assertTrue(SubProduct.objects.filter(sku='R-3', attributes__value='42').exists())
+
+    def test_failed_batch_reports_every_row_once(self):
+        with mock.patch.object(CatalogImporter, 'save', side_effect=Exception('database is locked')):
+            importer = self.run_import(self.get_row(), self.get_row(sku='R-2', brands=['Puma']))
+
+        self.assertEqual(importer.errors, [
+            (2, 'Unknown brand Puma'),
+            (1, 'Batch failed: database is locked'),
+        ])
+        self.assertEqual(importer.error_count, 2)
+
+
+BRAND_QUERY = '''
+    query($brand: String) {
+        products(brand: $brand) {
+            totalData
+            result { name }
+            facets { types { count } prices { count } }
+        }
+    }
+'''
+
+
+class FilteredCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(products=4)
+        cls.brand = Brand.objects.create(name='Nike')
+        for product in Product.objects.order_by('name')[:3]:
+            product.brand.add(cls.brand)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_counts_and_facets_follow_renamed_relations(self):
+        products = execute(BRAND_QUERY, brand='nike')['products']
+        self.assertEqual((products['totalData'], len(products['result'])), (3, 3))
+        self.assertEqual(products['facets']['types'][0]['count'], 3)
+
+        self.brand.name = 'Adidas'
+        self.brand.save()
+
+        products = execute(BRAND_QUERY, brand='nike')['products']
+        self.assertEqual((products['totalData'], products['result']), (0, []))
+        self.assertEqual(products['facets']['types'], [])
+
+    def test_cached_responses_follow_renamed_relations(self):
+        client = Client()
+
+        def get_names():
+            response = client.post(
+                '/graphql', {'query': BRAND_QUERY, 'variables': {'brand': 'nike'}}, content_type='application/json'
+            )
+            return [product['name'] for product in response.json()['data']['products']['result']]
+
+        self.assertEqual(len(get_names()), 3)
+        self.brand.name = 'Adidas'
+        self.brand.save()
+        self.assertEqual(get_names(), [])
+
+
+@override_settings(PRODUCT_RATING_PRIOR_COUNT=10, PRODUCT_RATING_PRIOR_MEAN=3.0)
+class RatingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        card = seed_catalog(products=1)
+        cls.user = card.user
+        cls.sub_product = SubProduct.objects.order_by('id').first()
+
+    def get_scores(self):
+        self.sub_product.refresh_from_db()
+        product = Product.objects.get(id=self.sub_product.product_id)
+        return self.sub_product.rating_score, product.max_rating_score
+
+    def test_unrated_score_doesnt_depend_on_history(self):
+        self.assertEqual(self.get_scores(), (0.0, 0.0))
+
+        comment = Comment.objects.create(user=self.user, sub_product=self.sub_product, rating=5)
+        score = (5 + 10 * 3.0) / (1 + 10)
+        self.assertAlmostEqual(self.get_scores()[0], score)
+        self.assertAlmostEqual(self.get_scores()[1], score)
+
+        comment.delete()
+        self.assertEqual(self.get_scores(), (0.0, 0.0))
+
+        call_command('rebuild_ratings', stdout=StringIO())
+        self.assertEqual(self.get_scores(), (0.0, 0.0))
+
+    def get_counters(self):
+        fields = ['rating_sum', 'number_of_comment', *(f'rating_{rating}' for rating in range(1, 6))]
+        row = SubProduct.objects.filter(id=self.sub_product.id).values(*fields, 'avg_rating', 'rating_score').get()
+        return {**row, 'avg_rating': round(row['avg_rating'], 6), 'rating_score': round(row['rating_score'], 6)}
+
+    def assertCounters(self, number_of_comment, histogram):
+        """The counters kept by the comments are the ones refresh_ratings() recomputes"""
+        counters = self.get_counters()
+        self.assertEqual(counters['number_of_comment'], number_of_comment)
+        self.assertEqual([counters[f'rating_{rating}'] for rating in range(1, 6)], histogram)
+
+        SubProduct.objects.filter(id=self.sub_product.id).refresh_ratings()
+        self.assertEqual(self.get_counters(), counters)
+
+    def test_comment_counters(self):
+        other = User.object.create_user(
+            email='buyer@example.com', password='password', first_name='Buyer', last_name='Shop',
+            dob=datetime.date(1990, 1, 1), phone_number='+998901234568', gender='F'
+        )
+        first = Comment.objects.create(user=self.user, sub_product=self.sub_product, rating=4)
+        second = Comment.objects.create(user=other, sub_product=self.sub_product, rating=2)
+        self.assertCounters(2, [0, 1, 0, 1, 0])
+
+        # A changed rating moves the comment to another bucket
+        first.rating = 5
+        first.save()
+        self.assertCounters(2, [0, 1, 0, 0, 1])
+
+        second.is_active = False
+        second.save()
+        self.assertCounters(1, [0, 0, 0, 0, 1])
+
+        second.is_active = True
+        second.save()
+        first.delete()
+        self.assertCounters(1, [0, 1, 0, 0, 0])
+
+
+class ReservationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = seed_catalog(products=1).user
+        cls.sub_product = SubProduct.objects.order_by('id').first()
+        cls.stock = Stock.objects.create(sub_product=cls.sub_product, units=5)
+
+    def get_stock(self):
+        self.stock.refresh_from_db()
+        product = Product.objects.get(id=self.sub_product.product_id)
+        return self.stock.units, self.stock.units_sold, product.units_in_stock
+
+    def test_sales_keep_the_product_caches(self):
+        tag = get_model_tag(Product)
+        version = get_tags_version([tag])
+        stock_version = get_tags_version([get_model_tag(Stock)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reservation = reserve_stock(self.user, self.sub_product.id, 2)
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+            commit_reservation(self.user, reservation.id)
+        # Selling held units doesn't change the units in stock of the product, its row isn't locked
+        self.assertFalse([query for query in queries if 'UPDATE "product_product"' in query['sql']])
+
+        self.assertEqual(get_tags_version([tag]), version)
+        self.assertNotEqual(get_tags_version([get_model_tag(Stock)]), stock_version)
+        self.assertEqual(self.get_stock(), (3, 2, 3))
+
+    def test_reserve_over_the_stock_fails(self):
+        with self.assertRaisesMessage(Exception, 'Not enough units in stock!'):
+            reserve_stock(self.user, self.sub_product.id, 6)
+        self.assertEqual(self.get_stock(), (5, 0, 5))
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_commit_counts_the_units_as_sold(self):
+        reservation = reserve_stock(self.user, self.sub_product.id, 2)
+        self.assertEqual(self.get_stock(), (3, 0, 3))
+
+        self.assertEqual(commit_reservation(self.user, reservation.id).status, StockReservation.COMMITTED)
+        self.assertEqual(self.get_stock(), (3, 2, 3))
+
+        with self.assertRaisesMessage(Exception, 'Reservation is already committed!'):
+            release_reservation(self.user, reservation.id)
+
+    def test_release_and_expiry_return_the_units(self):
+        released = reserve_stock(self.user, self.sub_product.id, 2)
+        expired = reserve_stock(self.user, self.sub_product.id, 3)
+        self.assertEqual(self.get_stock(), (0, 0, 0))
+
+        release_reservation(self.user, released.id)
+        self.assertEqual(self.get_stock(), (2, 0, 2))
+
+        StockReservation.objects.filter(id=expired.id).update(expires_at=timezone.now())
+        self.assertEqual(expire_reservations(), 1)
+        self.assertEqual(self.get_stock(), (5, 0, 5))
+        self.assertEqual(StockReservation.objects.get(id=expired.id).status, StockReservation.EXPIRED)
+
+    def test_commit_of_an_expired_hold_fails(self):
+        reservation = reserve_stock(self.user, self.sub_product.id, 2)
+        StockReservation.objects.filter(id=reservation.id).update(expires_at=timezone.now())
+
+        with self.assertRaisesMessage(Exception, 'Reservation has expired!'):
+            commit_reservation(self.user, reservation.id)
+        self.assertEqual(self.get_stock(), (3, 0, 3))
+
+        expire_reservations()
+        self.assertEqual(self.get_stock(), (5, 0, 5))
+
+
+class StockShardTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = seed_catalog(products=1).user
+        cls.sub_product = SubProduct.objects.order_by('id').first()
+        cls.stock = Stock.objects.create(sub_product=cls.sub_product, units=10, shard_count=4)
+        compact_stock(cls.stock.id)
+
+    def get_units(self):
+        """Units of the stock row and of its shards by number"""
+        self.stock.refresh_from_db()
+        shards = dict(StockShard.objects.filter(stock=self.stock).values_list('shard', 'units'))
+        return self.stock.units, [shards.get(shard) for shard in range(4)]
+
+    def test_compaction_spreads_the_units(self):
+        self.assertEqual(self.get_units(), (2, [2, 2, 2, 2]))
+
+    def test_takes_never_drive_a_shard_below_zero(self):
+        taken = 0
+        while move_shard_units(self.stock.id, 4, -3, units_sold=3):
+            taken += 3
+            units, shards = self.get_units()
+            self.assertGreaterEqual(min(units, *shards), 0)
+            self.assertEqual(units + sum(shards), 10 - taken)
+
+        self.assertEqual(taken, 9)
+        units, shards = self.get_units()
+        self.assertEqual(units + sum(shards), 1)
+
+    def test_compaction_folds_the_shards_into_the_stock(self):
+        move_shard_units(self.stock.id, 4, 5)
+        move_shard_units(self.stock.id, 4, -2, units_sold=2)
+        self.assertTrue(compact_stock(self.stock.id))
+
+        self.assertEqual(self.get_units(), (1, [3, 3, 3, 3]))
+        self.assertEqual(self.stock.units_sold, 2)
+        self.assertFalse(StockShard.objects.filter(stock=self.stock, units_sold__gt=0).exists())
+
+        # Taking more than the stock has fails without changing it
+        self.assertFalse(compact_stock(self.stock.id, -14))
+        self.assertEqual(self.get_units(), (1, [3, 3, 3, 3]))
+
+    def test_update_stock_clears_the_shards(self):
+        data = execute(
+            '''
+            mutation($subProductId: ID!, $stockId: ID!) {
+                updateStock(subProductId: $subProductId, stockId: $stockId, stockData: {units: 7}) {
+                    stock { units }
+                }
+            }
+            ''',
+            user=self.user, subProductId=self.sub_product.id, stockId=self.stock.id
+        )
+
+        self.assertEqual(data['updateStock']['stock']['units'], 7)
+        self.assertEqual(self.get_units(), (7, [0, 0, 0, 0]))
+        self.assertEqual(Product.objects.get(id=self.sub_product.product_id).units_in_stock, 7)
+
+
+class UniqueConstraintTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = seed_catalog(products=1).user
+        cls.buyer = User.object.create_user(
+            email='buyer@example.com', password='password', first_name='Buyer', last_name='Shop',
+            dob=datetime.date(1990, 1, 1), phone_number='+998901234568', gender='F'
+        )
+        cls.product = Product.objects.get()
+        cls.sub_product = SubProduct.objects.order_by('id').first()
+        cls.brand = Brand.objects.create(name='Nike')
+        cls.category = Category.objects.create(name='Sport')
+
+    def assertDuplicate(self, message, query, user, **variables):
+        """The second execution hits the unique constraint and reports the message"""
+        execute(query, user=user, **variables)
+        with self.assertRaisesMessage(Exception, message):
+            execute(query, user=user, **variables)
+
+    def test_product_name_per_card(self):
+        self.assertDuplicate(
+            'You already have a product with this name!',
+            '''
+            mutation($brand: ID, $category: ID, $type: ID) {
+                createProduct(
+                    brands: [{id: $brand}], categories: [{id: $category}], type: {id: $type},
+                    productData: {name: "Runner", description: "Light", gender: "A", isActive: true}
+                ) { status }
+            }
+            ''',
+            self.user, brand=self.brand.id, category=self.category.id, type=self.product.type_id,
+        )
+
+    def test_sku_per_product(self):
+        self.assertDuplicate(
+            'You already have a sub-product with this product code',
+            '''
+            mutation($product: ID!) {
+                createSubProduct(productId: $product, subProductData: {
+                    sku: "R-1", retailPrice: "20", salePrice: "15", storePrice: "10", weight: 1.0, isActive: true
+                }) { status }
+            }
+            ''',
+            self.user, product=self.product.id,
+        )
+
+    def test_comment_per_user(self):
+        self.assertDuplicate(
+            'You have already reviewed this product!',
+            '''
+            mutation($subProduct: ID!) {
+                createComment(subProductId: $subProduct, commentData: {rating: 4}) { status }
+            }
+            ''',
+            self.buyer, subProduct=self.sub_product.id,
+        )
+
+
+UPDATE_SUB_PRODUCT_MUTATION = '''
+    mutation($product: ID!, $subProduct: ID!, $data: SubProductInput!) {
+        updateSubProduct(productId: $product, subProductId: $subProduct, subProductData: $data) { status }
+    }
+'''
+
+
+class UpdateMutationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = seed_catalog(products=1).user
+        cls.other = User.object.create_user(
+            email='other@example.com', password='password', first_name='Other', last_name='Shop',
+            dob=datetime.date(1990, 1, 1), phone_number='+998901234569', gender='F'
+        )
+        cls.sub_product = SubProduct.objects.order_by('id').first()
+        cls.stock = Stock.objects.create(sub_product=cls.sub_product, units=5)
+
+    def update_sub_product(self, user, **changes):
+        data = {
+            'sku': 'S0-0', 'retailPrice': '20', 'salePrice': '10', 'storePrice': '15', 'weight': 1.0,
+            'isActive': True, **changes
+        }
+        return execute(
+            UPDATE_SUB_PRODUCT_MUTATION, user=user,
+            product=self.sub_product.product_id, subProduct=self.sub_product.id, data=data
+        )
+
+    def test_rows_of_other_users_are_rejected(self):
+        with self.assertRaisesMessage(Exception, 'Create a sub-product before updating!'):
+            self.update_sub_product(self.other, sku='S0-9')
+        with self.assertRaisesMessage(Exception, 'Create stock before updating!'):
+            execute(
+                '''
+                mutation($subProduct: ID!, $stock: ID!) {
+                    updateStock(subProductId: $subProduct, stockId: $stock, stockData: {units: 1}) { status }
+                }
+                ''',
+                user=self.other, subProduct=self.sub_product.id, stock=self.stock.id,
+            )
+
+        self.assertEqual(SubProduct.objects.get(id=self.sub_product.id).sku, 'S0-0')
+        self.assertEqual(Stock.objects.get(id=self.stock.id).units, 5)
+
+    def test_unchanged_payload_saves_nothing(self):
+        tags = [get_model_tag(SubProduct), get_model_tag(Product)]
+        version = get_tags_version(tags)
+
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+            self.update_sub_product(self.user, retailPrice='20.00')
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE')])
+        self.assertEqual(get_tags_version(tags), version)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.update_sub_product(self.user, retailPrice='21.004')
+        self.assertEqual(SubProduct.objects.get(id=self.sub_product.id).retail_price, Decimal('21.00'))
+        self.assertNotEqual(get_tags_version(tags), version)
+
+    def test_decimals_over_the_column_digits_are_field_errors(self):
+        message = 'retail_price must be a number with at most 7 digits before the decimal point!'
+        for price in ('10000000', '9999999.995', '1e30'):
+            with self.assertRaisesMessage(Exception, message):
+                self.update_sub_product(self.user, retailPrice=price)
+
+        self.update_sub_product(self.user, retailPrice='9999999.99')
+        self.assertEqual(SubProduct.objects.get(id=self.sub_product.id).retail_price, Decimal('9999999.99'))
@@ -1,3 +1,4 @@
+from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
 
 from .models import Brand, Category, Type
@@ -5,35 +6,48 @@ from .models import Brand, Category, Type
 
 class ProductData:
     """
-    Returns data to link from many to many fields.
+    Returns data to link from many to many fields. All referenced rows of a model
+    are checked by one in_bulk() and remembered for the request in the context.
     """
 
     @staticmethod
-    def get_brands(product_data):
-        brands = []
-        for product_brand in product_data:
+    def get_objects(model, product_data, message, context=None):
+        ids = []
+        invalid = []
+        for item in product_data:
             try:
-                brand = Brand.objects.get(pk=product_brand.id)
-            except Brand.DoesNotExist:
-                raise Exception(_("Enter an existing brands!"))
-            brands.append(brand)
-        return brands
+                pk = model._meta.pk.to_python(item.id)
+            except ValidationError:
+                pk = None
+            if pk is None:
+                invalid.append(str(item.id))
+            elif pk not in ids:
+                ids.append(pk)
+
+        lookups = {}
+        if context is not None:
+            if not hasattr(context, 'lookups'):
+                context.lookups = {}
+            lookups = context.lookups.setdefault(model, {})
+
+        missing = [pk for pk in ids if pk not in lookups]
+        if missing:
+            lookups.update(model.objects.in_bulk(missing))
+
+        invalid += [str(pk) for pk in ids if pk not in lookups]
+        if invalid:
+            raise Exception(f"{message} Not found: {', '.join(invalid)}")
+
+        return [lookups[pk] for pk in ids]
 
     @staticmethod
-    def get_categories(product_data):
-        categories = []
-        for product_category in product_data:
-            try:
-                category = Category.objects.get(pk=product_category.id)
-            except Category.DoesNotExist:
-                raise Exception(_("Enter an existing categories!"))
-            categories.append(category)
-        return categories
+    def get_brands(product_data, context=None):
+        return ProductData.get_objects(Brand, product_data, _("Enter an existing brands!"), context)
+
+    @staticmethod
+    def get_categories(product_data, context=None):
+        return ProductData.get_objects(Category, product_data, _("Enter an existing categories!"), context)
 
     @staticmethod
-    def get_type(product_data):
-        try:
-            product_type = Type.objects.get(id=product_data.id)
-        except Type.DoesNotExist:
-            raise Exception(_("Enter an existing type of product!"))
-        return product_type
+    def get_type(product_data, context=None):
+        return ProductData.get_objects(Type, [product_data], _("Enter an existing type of product!"), context)[0]
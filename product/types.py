@@ -1,72 +1,153 @@
-from graphene_django import DjangoObjectType
+import graphene
+
+from backend.loaders import BatchedObjectType, get_loader
+
+from .facets import get_brand_facet, get_category_facet, get_price_facet, get_type_facet
 
 from .models import (
     Attribute, BusinessCard, BusinessCardImage, Brand,
-    Category, Comment, Type, Product, SubProduct, SubProductImage, Stock
+    Category, Comment, Type, Product, SubProduct, SubProductImage, Stock, StockReservation, StockShard
 )
 
 
-class BusinessCardType(DjangoObjectType):
+class BusinessCardType(BatchedObjectType):
     class Meta:
         model = BusinessCard
         fields = '__all__'
 
 
-class BusinessCardImageType(DjangoObjectType):
+class BusinessCardImageType(BatchedObjectType):
     class Meta:
         model = BusinessCardImage
         fields = '__all__'
 
 
-class BrandType(DjangoObjectType):
+class BrandType(BatchedObjectType):
     class Meta:
         model = Brand
         fields = '__all__'
 
 
-class CategoryType(DjangoObjectType):
+class CategoryType(BatchedObjectType):
     class Meta:
         model = Category
         fields = '__all__'
 
 
-class TypeNode(DjangoObjectType):
+class TypeNode(BatchedObjectType):
     class Meta:
         model = Type
         fields = '__all__'
 
 
-class ProductType(DjangoObjectType):
+class ProductType(BatchedObjectType):
     class Meta:
         model = Product
         fields = '__all__'
 
 
-class SubProductType(DjangoObjectType):
+class SubProductType(BatchedObjectType):
     class Meta:
         model = SubProduct
         fields = '__all__'
 
 
-class StockType(DjangoObjectType):
+def get_counter_resolver(name):
+    """Resolver of a stock counter adding the shards of the stock to its row"""
+
+    def resolver(root, info, **kwargs):
+        loader = get_loader(info, StockShard, 'stock', True)
+        if loader is None:
+            return getattr(root, name) + sum(getattr(shard, name) for shard in root.shards.all())
+        return loader.load(root.pk).then(
+            lambda shards: getattr(root, name) + sum(getattr(shard, name) for shard in shards)
+        )
+
+    return resolver
+
+
+class StockType(BatchedObjectType):
     class Meta:
         model = Stock
+        exclude = ('shard_count',)
+
+    resolve_units = staticmethod(get_counter_resolver('units'))
+    resolve_units_sold = staticmethod(get_counter_resolver('units_sold'))
+
+
+class StockReservationType(BatchedObjectType):
+    class Meta:
+        model = StockReservation
         fields = '__all__'
 
 
-class AttributeType(DjangoObjectType):
+class AttributeType(BatchedObjectType):
     class Meta:
         model = Attribute
         fields = '__all__'
 
 
-class CommentType(DjangoObjectType):
+class CommentType(BatchedObjectType):
     class Meta:
         model = Comment
         fields = '__all__'
 
 
-class SubProductImageType(DjangoObjectType):
+class SubProductImageType(BatchedObjectType):
     class Meta:
         model = SubProductImage
         fields = '__all__'
+
+
+class ImportErrorType(graphene.ObjectType):
+    line = graphene.Int()
+    message = graphene.String()
+
+
+class SuggestionKind(graphene.Enum):
+    BRAND = 'brand'
+    CATEGORY = 'category'
+    TYPE = 'type'
+
+
+class SuggestionType(graphene.ObjectType):
+    id = graphene.ID()
+    name = graphene.String()
+
+
+def facet(model_type, name):
+    """Object of the model type with the number of the products in the facet"""
+    return type(f'{model_type}Facet', (graphene.ObjectType,), {
+        name: graphene.Field(model_type, resolver=lambda root, info: root),
+        'count': graphene.Int(),
+    })
+
+
+class PriceBucketType(graphene.ObjectType):
+    min_price = graphene.Float()
+    max_price = graphene.Float()
+    count = graphene.Int()
+
+
+class ProductFacetsType(graphene.ObjectType):
+    """Counts of the filtered products by brand, category, type and price, the root is the queryset"""
+    brands = graphene.List(facet(BrandType, 'brand'))
+    categories = graphene.List(facet(CategoryType, 'category'))
+    types = graphene.List(facet(TypeNode, 'type'))
+    prices = graphene.List(PriceBucketType)
+
+    @staticmethod
+    def resolve_brands(root, info):
+        return get_brand_facet(root)
+
+    @staticmethod
+    def resolve_categories(root, info):
+        return get_category_facet(root)
+
+    @staticmethod
+    def resolve_types(root, info):
+        return get_type_facet(root)
+
+    @staticmethod
+    def resolve_prices(root, info):
+        return get_price_facet(root)
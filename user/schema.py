@@ -1,9 +1,11 @@
 import graphene
+from django.db import transaction
 from graphene_file_upload.scalars import Upload
 from graphql_auth import mutations
 from graphql_auth.schema import UserQuery, MeQuery
 
-from backend.permissions import paginate, is_authenticated
+from backend.mutations import UpdateMutation
+from backend.permissions import PaginatedField, is_authenticated
 from .models import Address, UserImage
 from .types import AddressType, UserImageType
 
@@ -81,7 +83,7 @@ class CreateAddress(graphene.Mutation):
         return CreateAddress(address=address)
 
 
-class UpdateAddress(graphene.Mutation):
+class UpdateAddress(UpdateMutation):
     """Updating a user address"""
     address = graphene.Field(AddressType)
 
@@ -94,20 +96,22 @@ class UpdateAddress(graphene.Mutation):
     def mutate(self, info, address_id, address_data, is_default=False):
         user = info.context.user
 
-        Address.objects.filter(
-            user=user,
-            id=address_id
-        ).update(**address_data, is_default=is_default)
-
-        if is_default:
-            Address.objects.filter(user=user).exclude(
-                id=address_id
-            ).update(
-                is_default=False
+        with transaction.atomic():
+            address = UpdateAddress.get_for_update(
+                Address.objects.filter(user=user, id=address_id),
+                "Create an address before updating!"
             )
+            UpdateAddress.save_changes(address, {**address_data, 'is_default': is_default})
+
+            if is_default:
+                Address.objects.filter(user=user, is_default=True).exclude(
+                    id=address_id
+                ).update(
+                    is_default=False
+                )
 
         return UpdateAddress(
-            address=Address.objects.get(id=address_id)
+            address=address
         )
 
 
@@ -131,10 +135,10 @@ class DeleteAddress(graphene.Mutation):
 
 
 class Query(UserQuery, MeQuery, graphene.ObjectType):
-    image_uploads = graphene.Field(paginate(UserImageType), page=graphene.Int())
+    image_uploads = PaginatedField(UserImageType)
 
     @staticmethod
-    def resolve_image_uploads(info, **kwargs):
+    def resolve_image_uploads(cls, info, **kwargs):
         return UserImage.objects.filter(**kwargs)
 
 
@@ -0,0 +1,12 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from backend.cache import invalidate_models
+from .models import User, UserImage
+
+
+@receiver([post_save, post_delete], sender=User)
+@receiver([post_save, post_delete], sender=UserImage)
+def invalidate_user_cache(sender, **kwargs):
+    """Outdate cached image counts and responses when users or their images change"""
+    invalidate_models(sender)
@@ -1,19 +1,19 @@
-from graphene_django import DjangoObjectType
+from backend.loaders import BatchedObjectType
 
 from .models import Address, User, UserImage
 
 
-class UserType(DjangoObjectType):
+class UserType(BatchedObjectType):
     class Meta:
         model = User
         exclude = ('password',)
 
 
-class UserImageType(DjangoObjectType):
+class UserImageType(BatchedObjectType):
     class Meta:
         model = UserImage
 
 
-class AddressType(DjangoObjectType):
+class AddressType(BatchedObjectType):
     class Meta:
         model = Address